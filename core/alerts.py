@@ -0,0 +1,160 @@
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from core.config import config, get_int
+from core.rebuild import PeriodicRebuild
+
+
+# an item that keeps falling alerts a watcher again after this many seconds at the earliest
+ALERT_COOLDOWN = get_int("ALERT_COOLDOWN_SECONDS", 6 * 3600)
+ALERT_ITEM_FIELDS = {"url_name": 1, "item_name": 1, "median_price": 1}
+ALERTING_USERS = {"notifications.email_alerts": True, "notifications.price_drop_threshold": {"$gt": 0}}
+
+
+class PrintSink:
+    """Logs alert batches, the default until a real delivery channel is configured"""
+
+    def send(self, batch):
+        for alert in batch:
+            print(f"Price alert for {alert['email']}: {[item['url_name'] for item in alert['items']]}")
+
+
+class FileSink:
+    """Appends every alert as a JSON line, for a mailer or another process to pick up"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, batch):
+        with self._lock, open(self.path, "a") as f:
+            for alert in batch:
+                f.write(json.dumps(alert, default=str) + "\n")
+
+
+class QueueSink:
+    """Puts alert batches on an in-process queue, alerts are dropped once maxsize batches wait"""
+
+    def __init__(self, maxsize=1000):
+        self.queue = queue.Queue(maxsize)
+
+    def send(self, batch):
+        try:
+            self.queue.put_nowait(batch)
+        except queue.Full:
+            print(f"Alert queue full, dropped {len(batch)} alerts")
+
+
+def default_sink():
+    path = config.get("ALERTS_FILE")
+    return FileSink(path) if path else PrintSink()
+
+
+class AlertEngine(PeriodicRebuild):
+    """
+    Price drop alerts driven by an inverted index from item _id to its watchers.
+
+    Every user with email_alerts on and a price_drop_threshold watches the items
+    of their watchlist and of every list they own. A stats refresh looks up only
+    the watchers of the items whose price fell, so an evaluation costs the number
+    of changed items and their watchers, never the number of users. Alerts are
+    deduped per (user, item) for ALERT_COOLDOWN seconds and every evaluation
+    hands the sink one batch with a single alert per user.
+    """
+
+    def __init__(self, sink=None):
+        self._lock = threading.RLock()
+        self._watchers = defaultdict(dict)  # item _id -> {user _id: threshold}
+        self._users = {}  # user _id -> (email, set of watched item _ids)
+        self._sent = {}  # (user _id, item _id) -> monotonic time of the last alert
+        self.sink = sink or default_sink()
+
+    def build(self, db):
+        """Replace the whole index with the watches of every alerting user"""
+        users = list(db["users"].find(ALERTING_USERS, {"email": 1, "watchlist": 1, "notifications": 1}))
+        lists = defaultdict(list)
+        for lst in db["lists"].find({"owner_id": {"$in": [user["_id"] for user in users]}}, {"owner_id": 1, "items": 1}):
+            lists[lst["owner_id"]].append(lst)
+        with self._lock:
+            self._watchers.clear()
+            self._users.clear()
+            for user in users:
+                self._add(user, lists[user["_id"]])
+            self.mark_built()
+
+    def refresh_user(self, db, query):
+        """Re-read one user's settings and lists, e.g. after they edit a list, a no-op before the first build"""
+        if self.built_at is None:
+            return
+        user = db["users"].find_one(query, {"email": 1, "watchlist": 1, "notifications": 1})
+        if user is None:
+            return
+        lists = list(db["lists"].find({"owner_id": user["_id"]}, {"items": 1}))
+        with self._lock:
+            self._remove(user["_id"])
+            self._add(user, lists)
+
+    def _add(self, user, lists):
+        notifications = user.get("notifications") or {}
+        threshold = notifications.get("price_drop_threshold")
+        if not notifications.get("email_alerts") or not threshold or threshold <= 0:
+            return
+        items = set(user.get("watchlist") or ())
+        for lst in lists:
+            items.update(lst.get("items") or ())
+        self._users[user["_id"]] = (user.get("email"), items)
+        for item_id in items:
+            self._watchers[item_id][user["_id"]] = threshold
+
+    def _remove(self, user_id):
+        _, items = self._users.pop(user_id, (None, ()))
+        for item_id in items:
+            watchers = self._watchers.get(item_id)
+            if watchers is not None:
+                watchers.pop(user_id, None)
+                if not watchers:
+                    del self._watchers[item_id]
+
+    def evaluate(self, db, before, after):
+        """
+        Alert the watchers of every item whose median_price fell by at least their
+        threshold percent between before and after ({item _id: item doc}).
+        Returns the batch handed to the sink.
+        """
+        self.ensure_built(db)
+        now = time.monotonic()
+        alerts = defaultdict(list)
+        with self._lock:
+            for item_id, item in after.items():
+                old = (before.get(item_id) or {}).get("median_price")
+                new = item.get("median_price")
+                if not old or new is None or new >= old or item_id not in self._watchers:
+                    continue
+                drop = (old - new) / old * 100
+                for user_id, threshold in self._watchers[item_id].items():
+                    sent = self._sent.get((user_id, item_id))
+                    if drop < threshold or (sent is not None and now - sent < ALERT_COOLDOWN):
+                        continue
+                    self._sent[(user_id, item_id)] = now
+                    alerts[user_id].append({"item_id": item_id, "url_name": item.get("url_name"),
+                                            "item_name": item.get("item_name"), "old_price": old,
+                                            "new_price": new, "drop_pct": round(drop, 2)})
+            self._prune_sent(now)
+            batch = [{"user_id": str(user_id), "email": self._users[user_id][0],
+                      "created_at": datetime.utcnow(), "items": items}
+                     for user_id, items in alerts.items()]
+        if batch:
+            self.sink.send(batch)
+        return batch
+
+    def _prune_sent(self, now):
+        if len(self._sent) > 10000:
+            self._sent = {key: sent for key, sent in self._sent.items() if now - sent < ALERT_COOLDOWN}
+
+
+# Singleton instance evaluated by the item write paths
+alert_engine = AlertEngine()
@@ -0,0 +1,161 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from core.history import PRICE_ROLLUPS_COLLECTION, bucket_start
+
+
+DEFAULT_PERIODS = 30
+MAX_PERIODS = 365
+DEFAULT_SPAN = 7
+DEFAULT_WINDOW = 7
+DEFAULT_MOVERS = 10
+RESOLUTION_STEPS = {"hour": timedelta(hours=1), "day": timedelta(days=1), "week": timedelta(weeks=1)}
+SNAPSHOT_ITEM_FIELDS = {"item_name": 1, "url_name": 1, "item_type": 1, "median_price": 1, "volume": 1}
+
+
+class Snapshot:
+    """
+    Columnar view of the catalog's recent history: one row per item and one column
+    per rollup bucket, oldest first. Gaps are forward filled, buckets before an
+    item's first point take that first point, and items without any history are a
+    flat line at their current stats.
+    """
+
+    def __init__(self, items, starts, prices, volumes):
+        self.items = items
+        self.starts = starts
+        self.prices = prices
+        self.volumes = volumes
+        self.item_types = np.array([item.get("item_type") or "" for item in items])
+
+    def __len__(self):
+        return len(self.items)
+
+    def select(self, item_type=None):
+        """Row mask for one item_type, or every row"""
+        if not item_type:
+            return np.ones(len(self.items), dtype=bool)
+        return self.item_types == item_type
+
+
+def _fill_gaps(values):
+    """Forward fill NaNs along each row, then back fill the leading ones"""
+    n, t = values.shape
+    rows = np.arange(n)[:, None]
+    valid = ~np.isnan(values)
+    last = np.maximum.accumulate(np.where(valid, np.arange(t), 0), axis=1)
+    values = values[rows, last]
+    first = np.argmax(valid, axis=1)
+    leading = np.arange(t) < first[:, None]
+    return np.where(leading, values[np.arange(n), first][:, None], values)
+
+
+def load_snapshot(db, resolution="day", periods=DEFAULT_PERIODS, now=None):
+    """Reads the last `periods` rollup buckets of every item into price and volume matrices"""
+    step = RESOLUTION_STEPS[resolution]
+    last = bucket_start(now or datetime.utcnow(), resolution)
+    starts = [last - step * i for i in range(periods - 1, -1, -1)]
+    column = {start: i for i, start in enumerate(starts)}
+
+    items = list(db["items"].find({}, SNAPSHOT_ITEM_FIELDS))
+    row = {item["_id"]: i for i, item in enumerate(items)}
+    prices = np.full((len(items), periods), np.nan)
+    volumes = np.zeros((len(items), periods))
+
+    buckets = db[PRICE_ROLLUPS_COLLECTION].find(
+        {"resolution": resolution, "start": {"$gte": starts[0]}},
+        {"_id": 0, "item_id": 1, "start": 1, "samples": 1, "price_sum": 1, "volume_sum": 1})
+    for bucket in buckets:
+        i, j = row.get(bucket["item_id"]), column.get(bucket["start"])
+        if i is not None and j is not None:
+            prices[i, j] = bucket["price_sum"] / bucket["samples"]
+            volumes[i, j] = bucket["volume_sum"] / bucket["samples"]
+
+    # items never refreshed in the window fall back to their current stats
+    empty = np.isnan(prices).all(axis=1)
+    prices[empty, -1] = [items[i].get("median_price") or 0 for i in np.flatnonzero(empty)]
+    volumes[empty, -1] = [items[i].get("volume") or 0 for i in np.flatnonzero(empty)]
+    if len(items):
+        prices = _fill_gaps(prices)
+    return Snapshot(items, starts, prices, volumes)
+
+
+def ema(prices, span):
+    """Exponential moving average of every row, evaluated at the last column"""
+    alpha = 2 / (span + 1)
+    average = prices[:, 0].copy()
+    for t in range(1, prices.shape[1]):
+        average += alpha * (prices[:, t] - average)
+    return average
+
+
+def log_returns(prices):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.diff(np.log(np.where(prices > 0, prices, np.nan)), axis=1)
+    return np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def volatility(prices, window):
+    """Standard deviation of the last `window` log returns of every row"""
+    returns = log_returns(prices)[:, -window:]
+    if returns.shape[1] < 2:
+        return np.zeros(len(prices))
+    return returns.std(axis=1, ddof=1)
+
+
+def pct_change(prices, periods):
+    """Percent change of every row over the last `periods` buckets, 0 where the base price is 0"""
+    periods = min(periods, prices.shape[1] - 1)
+    if periods < 1:
+        return np.zeros(len(prices))
+    base, latest = prices[:, -1 - periods], prices[:, -1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = np.where(base > 0, (latest - base) / base * 100, 0.0)
+    return change
+
+
+def vwap(prices, volumes, window):
+    """Volume weighted average price over the last `window` buckets, the last price where nothing traded"""
+    p, v = prices[:, -window:], volumes[:, -window:]
+    traded = v.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(traded > 0, (p * v).sum(axis=1) / traded, prices[:, -1])
+
+
+def trend_metrics(snapshot, mask, span=DEFAULT_SPAN, window=DEFAULT_WINDOW):
+    """Every metric for the masked rows as columns, computed in a handful of array operations"""
+    prices, volumes = snapshot.prices[mask], snapshot.volumes[mask]
+    return {
+        "price": prices[:, -1],
+        "ema": ema(prices, span),
+        "volatility": volatility(prices, window),
+        "pct_change": pct_change(prices, window),
+        "vwap": vwap(prices, volumes, window),
+        "volume": volumes[:, -window:].sum(axis=1),
+    }
+
+
+def top_movers(values, n, direction="up"):
+    """
+    Indexes of the n largest (up), smallest (down) or largest absolute (abs) values,
+    best first. argpartition finds them in linear time, only those n get sorted.
+    """
+    keys = {"up": -values, "down": values, "abs": -np.abs(values)}[direction]
+    n = min(n, len(keys))
+    if n == 0:
+        return np.array([], dtype=int)
+    top = np.argpartition(keys, n - 1)[:n]
+    return top[np.argsort(keys[top], kind="stable")]
+
+
+def metric_rows(snapshot, mask, metrics, indexes=None):
+    """JSON rows for the masked items (optionally only the given positions within the mask)"""
+    items = [snapshot.items[i] for i in np.flatnonzero(mask)]
+    positions = range(len(items)) if indexes is None else indexes
+    return [{"_id": items[i]["_id"],
+             "url_name": items[i].get("url_name"),
+             "item_name": items[i].get("item_name"),
+             "item_type": items[i].get("item_type"),
+             **{name: round(float(values[i]), 4) for name, values in metrics.items()}}
+            for i in positions]
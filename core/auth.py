@@ -1,23 +1,62 @@
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from pymongo import MongoClient
 from bson import ObjectId
 from typing import Optional
-import os
-from dotenv import dotenv_values
+from collections import OrderedDict
+import time
+
+from core.config import config
+from core.db import get_database, run_db
 
 # Reusable components
 # oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
+AUTH_CACHE_MAX_ENTRIES = 10000
+AUTH_CACHE_TTL = 300
+
+
+class TokenCache:
+    """
+    Bounded cache of validated token -> user id. An entry never outlives the
+    token's exp claim or `ttl` seconds.
+    """
+
+    def __init__(self, max_entries=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, token):
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self._entries[token]
+            return None
+        self._entries.move_to_end(token)
+        return entry[1]
+
+    def put(self, token, user_id, exp=None):
+        expires = time.time() + self.ttl
+        if exp is not None:
+            expires = min(expires, exp)
+        self._entries[token] = (expires, user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
 class AuthService:
     def __init__(self):
-        config = dotenv_values(".env")
-        self.client = MongoClient(config.get("ATLAS_URI"))
-        self.db = self.client[config.get("DB_NAME")]
         self.secret_key = config.get("TOKEN_KEY")
         self.algorithm = config.get("ALGORITHM")
+        self.token_cache = TokenCache()
+
+    @property
+    def db(self):
+        # shares the application's client, so auth queries use the same connection pool
+        return get_database()
 
     async def get_current_user_id(self, token: str = Depends(oauth2_scheme)) -> ObjectId:
         """Centralized user ID resolver"""
@@ -27,17 +66,29 @@ class AuthService:
             headers={"WWW-Authenticate": "Bearer"},
         )
         
+        user_id = self.token_cache.get(token)
+        if user_id is not None:
+            return user_id
+
         try:
             payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
             email: str = payload.get("sub")
             if not email:
                 raise credentials_exception
-                
-            user = self.db.users.find_one({"email": email})
-            if not user:
-                raise credentials_exception
-                
-            return user["_id"]  # Returns ObjectId
+
+            # newer tokens carry the user id and the signature vouches for it,
+            # older ones are resolved through the email
+            uid = payload.get("uid")
+            if uid and ObjectId.is_valid(uid):
+                user_id = ObjectId(uid)
+            else:
+                user = await run_db(self.db.users.find_one, {"email": email}, {"_id": 1})
+                if not user:
+                    raise credentials_exception
+                user_id = user["_id"]
+
+            self.token_cache.put(token, user_id, payload.get("exp"))
+            return user_id  # Returns ObjectId
             
         except JWTError:
             raise credentials_exception
@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+
+DEFAULT_MAX_ENTRIES = 2048
+DEFAULT_TTL = 300
+
+
+class _Flight:
+    """A load in progress that concurrent misses for the same key wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class CatalogCache:
+    """
+    Bounded in-process read cache for item queries.
+
+    Entries expire after `ttl` seconds and the least recently used entry is
+    dropped once `max_entries` is reached. Every entry carries tags (item id,
+    url_name, item_type) so writes can invalidate exactly the entries they
+    affect. Concurrent misses for the same key share a single load.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._tags = defaultdict(set)
+        self._flights = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "invalidations": 0}
+
+    def get_or_load(self, key, loader, tags=()):
+        """
+        Returns the cached value for key, or calls loader() once to produce it.
+        `tags` is an iterable of tags or a callable building them from the loaded value.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[1]
+            if entry is not None:
+                self._remove(key)
+            if (flight := self._flights.get(key)) is not None:
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                flight = self._flights[key] = _Flight()
+                self._stats["misses"] += 1
+                leader = True
+            generation = self._generation
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            value = loader()
+            entry_tags = set(tags(value) if callable(tags) else tags)
+        except BaseException as e:
+            flight.error = e
+            raise
+        else:
+            flight.value = value
+            with self._lock:
+                # anything invalidated while loading may be stale, so hand it out but don't keep it
+                if generation == self._generation:
+                    self._store(key, value, entry_tags)
+            return value
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _store(self, key, value, tags):
+        self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+        for tag in tags:
+            self._tags[tag].add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self._stats["evictions"] += 1
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, *tags):
+        """Drops every entry carrying any of the tags"""
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"] + self._stats["coalesced"]
+            return {**self._stats, "entries": len(self._entries),
+                    "hit_ratio": round(self._stats["hits"] / lookups, 4) if lookups else 0.0}
+
+
+# Singleton instance caching reads of the items collection
+item_cache = CatalogCache()
@@ -0,0 +1,10 @@
+from dotenv import dotenv_values
+
+
+# Settings read once from .env and shared by the app, routers and core modules
+config = dotenv_values(".env")
+
+
+def get_int(name, default):
+    value = config.get(name)
+    return int(value) if value else default
@@ -0,0 +1,138 @@
+import asyncio
+import functools
+import importlib.util
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo import MongoClient, monitoring
+
+from core.config import config, get_int
+
+
+# pymongo is blocking, so async route handlers run their queries on this pool
+# instead of the event loop. Size it alongside the Mongo connection pool.
+DB_THREADS = get_int("DB_THREADS", 32)
+db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="mongo")
+
+# Connection pool tuning, every value can be overridden in .env
+MONGO_MAX_POOL_SIZE = get_int("MONGO_MAX_POOL_SIZE", DB_THREADS)
+MONGO_MIN_POOL_SIZE = get_int("MONGO_MIN_POOL_SIZE", 0)
+MONGO_MAX_IDLE_TIME_MS = get_int("MONGO_MAX_IDLE_TIME_MS", 60000)
+MONGO_CONNECT_TIMEOUT_MS = get_int("MONGO_CONNECT_TIMEOUT_MS", 10000)
+MONGO_SERVER_SELECTION_TIMEOUT_MS = get_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000)
+MONGO_WAIT_QUEUE_TIMEOUT_MS = get_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000)
+# zstd needs the zstandard package and snappy needs python-snappy, so by default
+# offer whichever of them is installed ahead of zlib, which is always available
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+MONGO_COMPRESSORS = config.get("MONGO_COMPRESSORS") or ",".join(
+    name for name, module in COMPRESSOR_MODULES.items() if importlib.util.find_spec(module))
+
+CHECKOUT_SAMPLES = 1000
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Records how long connection checkouts wait so the pool can be sized under real load"""
+
+    def __init__(self, samples=CHECKOUT_SAMPLES):
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=samples)
+        self._stats = {"checkouts": 0, "checkout_failures": 0, "checked_out": 0,
+                       "connections_created": 0, "connections_closed": 0, "pool_clears": 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["checked_out"] += 1
+            if event.duration is not None:
+                self._waits.append(event.duration)
+
+    def connection_check_out_failed(self, event):
+        self._count("checkout_failures")
+
+    def connection_checked_in(self, event):
+        self._count("checked_out", -1)
+
+    def connection_created(self, event):
+        self._count("connections_created")
+
+    def connection_closed(self, event):
+        self._count("connections_closed")
+
+    def pool_cleared(self, event):
+        self._count("pool_clears")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            stats = {**self._stats, "max_pool_size": MONGO_MAX_POOL_SIZE}
+        if waits:
+            stats["checkout_wait_ms"] = {
+                "p50": round(waits[len(waits) // 2] * 1000, 3),
+                "p95": round(waits[int(len(waits) * 0.95) - 1] * 1000, 3),
+                "max": round(waits[-1] * 1000, 3),
+            }
+        return stats
+
+
+# Singleton monitor registered on the shared client
+pool_monitor = PoolMonitor()
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The application wide MongoClient, created on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = MongoClient(
+                config.get("ATLAS_URI"),
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                compressors=MONGO_COMPRESSORS,
+                event_listeners=[pool_monitor],
+            )
+        return _client
+
+
+def get_database():
+    return get_client()[config.get("DB_NAME")]
+
+
+def close_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+async def run_db(fn, *args, **kwargs):
+    """Run a blocking database call on the db thread pool and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(fn, *args, **kwargs))
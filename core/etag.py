@@ -0,0 +1,58 @@
+import hashlib
+import threading
+import time
+
+from fastapi import Request, Response, status
+
+
+VERSIONS_COLLECTION = "versions"
+ITEMS_VERSION = "items"
+LISTS_VERSION = "lists"
+# how long a worker trusts its last read of a version before asking Mongo again
+VERSION_TTL = 1.0
+
+_versions = {}
+_lock = threading.Lock()
+
+
+def get_version(db, name):
+    """Write counter of a collection, bumped by every write path that changes it"""
+    now = time.monotonic()
+    with _lock:
+        cached = _versions.get(name)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+    doc = db[VERSIONS_COLLECTION].find_one({"_id": name})
+    version = doc["version"] if doc else 0
+    with _lock:
+        _versions[name] = (now + VERSION_TTL, version)
+    return version
+
+
+def bump_version(db, name):
+    doc = db[VERSIONS_COLLECTION].find_one_and_update(
+        {"_id": name}, {"$inc": {"version": 1}}, upsert=True, return_document=True)
+    with _lock:
+        _versions[name] = (time.monotonic() + VERSION_TTL, doc["version"])
+    return doc["version"]
+
+
+def make_etag(*parts):
+    return '"' + hashlib.sha1(repr(parts).encode()).hexdigest()[:24] + '"'
+
+
+def request_etag(request: Request, *versions):
+    """Strong ETag for a GET request: the data versions it reads plus its path and query string"""
+    return make_etag(*versions, request.url.path, sorted(request.query_params.multi_items()))
+
+
+def is_not_modified(request: Request, etag):
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates or "*" in candidates
+
+
+def not_modified_response(etag):
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
@@ -0,0 +1,45 @@
+import json
+import zlib
+from datetime import datetime
+
+from bson import ObjectId
+
+
+EXPORT_BATCH_SIZE = 500
+# encoded lines are buffered up to this many bytes before being sent
+CHUNK_SIZE = 64 * 1024
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def ndjson_stream(cursor, gzip=False):
+    """
+    Encode documents from a Mongo cursor as newline delimited JSON while it is
+    being iterated, optionally gzip compressed, so memory stays flat no matter
+    how many documents the cursor returns.
+    """
+    compressor = zlib.compressobj(wbits=31) if gzip else None
+    buffer = []
+    size = 0
+    for doc in cursor:
+        line = json.dumps(doc, default=_default, separators=(",", ":")).encode() + b"\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            chunk = b"".join(buffer)
+            buffer, size = [], 0
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+    chunk = b"".join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+from pymongo import DESCENDING, UpdateOne
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+
+PRICE_HISTORY_COLLECTION = "price_history"
+PRICE_ROLLUPS_COLLECTION = "price_rollups"
+ROLLUP_RESOLUTIONS = ("hour", "day", "week")
+DEFAULT_HISTORY_POINTS = 500
+MAX_HISTORY_POINTS = 5000
+
+
+def ensure_history_collections(db):
+    """
+    Creates price_history as a time-series collection when the server supports it
+    (MongoDB 5.0+), a plain collection otherwise. Must run before its indexes are
+    reconciled, since creating an index first would make a plain collection.
+    """
+    if PRICE_HISTORY_COLLECTION in db.list_collection_names():
+        return
+    try:
+        db.create_collection(PRICE_HISTORY_COLLECTION,
+                             timeseries={"timeField": "ts", "metaField": "item_id", "granularity": "hours"})
+    except (OperationFailure, CollectionInvalid) as e:
+        print(f"Time-series collections unavailable ({e}), storing price history in a plain collection")
+
+
+def bucket_start(ts, resolution):
+    """Start of the hour, day or (Monday based) week containing ts"""
+    if resolution == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    day = ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    if resolution == "day":
+        return day
+    return day - timedelta(days=day.weekday())
+
+
+def record_prices(db, items, ts=None):
+    """
+    Appends a history point per item ({_id, median_price, volume}) and folds it into
+    that item's hourly, daily and weekly rollup buckets, all in two writes.
+    Points are expected in time order, the last one recorded becomes a bucket's close.
+    """
+    items = [item for item in items if item.get("median_price") is not None]
+    if not items:
+        return
+    ts = ts or datetime.utcnow()
+    db[PRICE_HISTORY_COLLECTION].insert_many(
+        [{"item_id": item["_id"], "ts": ts, "median_price": item["median_price"], "volume": item.get("volume") or 0}
+         for item in items], ordered=False)
+
+    operations = []
+    for item in items:
+        price, volume = item["median_price"], item.get("volume") or 0
+        for resolution in ROLLUP_RESOLUTIONS:
+            operations.append(UpdateOne(
+                {"item_id": item["_id"], "resolution": resolution, "start": bucket_start(ts, resolution)},
+                {"$inc": {"samples": 1, "price_sum": price, "volume_sum": volume},
+                 "$min": {"min_price": price},
+                 "$max": {"max_price": price},
+                 "$setOnInsert": {"open": price},
+                 "$set": {"close": price, "ts": ts}},
+                upsert=True))
+    db[PRICE_ROLLUPS_COLLECTION].bulk_write(operations, ordered=False)
+
+
+def get_history(db, item_id, resolution="day", since=None, until=None, limit=DEFAULT_HISTORY_POINTS):
+    """
+    Price points of one item, oldest first. Raw reads the appended points, every other
+    resolution reads the precomputed buckets, so a year of daily history is ~365 documents.
+    """
+    time_field = "ts" if resolution == "raw" else "start"
+    query = {"item_id": item_id}
+    if resolution != "raw":
+        query["resolution"] = resolution
+    if since or until:
+        query[time_field] = {op: value for op, value in (("$gte", since), ("$lt", until)) if value}
+
+    collection = PRICE_HISTORY_COLLECTION if resolution == "raw" else PRICE_ROLLUPS_COLLECTION
+    # newest `limit` points, flipped back to chronological order
+    docs = list(db[collection].find(query, {"_id": 0}).sort(time_field, DESCENDING).limit(limit))
+    docs.reverse()
+    if resolution == "raw":
+        return docs
+    return [{"ts": doc["start"],
+             "median_price": round(doc["price_sum"] / doc["samples"], 2),
+             "volume": round(doc["volume_sum"] / doc["samples"], 2),
+             "min_price": doc["min_price"],
+             "max_price": doc["max_price"],
+             "open": doc["open"],
+             "close": doc["close"],
+             "samples": doc["samples"]}
+            for doc in docs]
@@ -0,0 +1,135 @@
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from core.market_client import endpoint_name
+
+
+DEFAULT_CACHE_PATH = ".market_cache.sqlite3"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_TTL = 60 * 60
+# cache hits only note their access time in memory, it is written out in one batch
+# once this many are pending or with the next write (eviction reads it)
+ACCESS_FLUSH_SIZE = 256
+# seconds a cached response is served without asking upstream, keyed by endpoint template
+DEFAULT_TTLS = {
+    "items": 24 * 60 * 60,
+    "items/{url_name}": 7 * 24 * 60 * 60,
+    "items/{url_name}/statistics": 60 * 60,
+    "items/{url_name}/orders": 5 * 60,
+}
+
+
+class CacheEntry:
+    def __init__(self, body, etag, last_modified, fetched_at):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+
+class ResponseCache:
+    """
+    On-disk HTTP response cache keyed by URL, backed by sqlite.
+
+    Entries younger than their endpoint's TTL are served without a request,
+    older ones are revalidated with If-None-Match/If-Modified-Since so an
+    unchanged resource only costs a 304. Once the cache grows past `max_bytes`
+    the least recently used entries are evicted.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, ttls=None, default_ttl=DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.default_ttl = default_ttl
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._accessed = {}
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                size INTEGER NOT NULL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._db.commit()
+
+    def ttl_for(self, url):
+        return self.ttls.get(endpoint_name(urlparse(url).path.removeprefix("/v1")), self.default_ttl)
+
+    def get(self, url):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM responses WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            self._accessed[url] = time.time()
+            if len(self._accessed) >= ACCESS_FLUSH_SIZE:
+                self._flush_access()
+                self._db.commit()
+        return CacheEntry(*row)
+
+    def _flush_access(self):
+        """Write the pending access times, the caller holds the lock and commits"""
+        if self._accessed:
+            self._db.executemany("UPDATE responses SET last_access = ? WHERE url = ?",
+                                 [(accessed, url) for url, accessed in self._accessed.items()])
+            self._accessed.clear()
+
+    def is_fresh(self, url, entry):
+        return time.time() - entry.fetched_at < self.ttl_for(url)
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def put(self, url, body, etag=None, last_modified=None):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, body, etag, last_modified, now, now, len(body)))
+            self._accessed.pop(url, None)
+            self._flush_access()
+            self._evict()
+            self._db.commit()
+
+    def revalidated(self, url):
+        """Upstream answered 304, the cached body is good for another TTL"""
+        now = time.time()
+        with self._lock:
+            self._db.execute("UPDATE responses SET fetched_at = ?, last_access = ? WHERE url = ?", (now, now, url))
+            self._db.commit()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for url, size in self._db.execute("SELECT url, size FROM responses ORDER BY last_access").fetchall():
+            self._db.execute("DELETE FROM responses WHERE url = ?", (url,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._flush_access()
+            self._db.commit()
+        self._db.close()
@@ -0,0 +1,161 @@
+import argparse
+
+from bson import ObjectId
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+from core.history import ensure_history_collections
+from models.historyModels import PRICE_HISTORY_INDEXES, PRICE_ROLLUP_INDEXES
+from models.itemModels import ITEM_INDEXES
+from models.listModel import LIST_INDEXES
+from models.userModel import USER_INDEXES
+
+
+# Every collection's indexes, declared next to its model
+COLLECTION_INDEXES = {
+    "items": ITEM_INDEXES,
+    "lists": LIST_INDEXES,
+    "users": USER_INDEXES,
+    "price_history": PRICE_HISTORY_INDEXES,
+    "price_rollups": PRICE_ROLLUP_INDEXES,
+}
+
+# server-side bookkeeping that doesn't affect whether an index matches its declaration
+IGNORED_OPTIONS = ("key", "name", "v", "ns")
+
+# (collection, description, filter, sort) for the queries the app runs on every request
+HOT_QUERIES = [
+    ("items", "items by type sorted by name", {"item_type": "MOD"}, [("item_name", 1), ("_id", 1)]),
+    ("items", "items by type sorted by price", {"item_type": "MOD"}, [("median_price", -1), ("_id", -1)]),
+    ("items", "item by url_name", {"url_name": "wisp_prime_blueprint"}, None),
+    ("items", "arcanes by tag", {"tags": {"$in": ["arcane_enhancement"]}}, None),
+    ("items", "stalest items first", {}, [("last_updated", 1), ("_id", 1)]),
+    ("items", "item name search", {"item_name": {"$regex": "prime", "$options": "i"}}, None),
+    ("lists", "lists of a user", {"owner_id": ObjectId()}, None),
+    ("lists", "list by id and owner", {"_id": ObjectId(), "owner_id": ObjectId()}, None),
+    ("users", "user by email", {"email": "someone@example.com"}, None),
+    ("users", "user by username", {"username": "someone"}, None),
+]
+
+
+def _options(spec):
+    return {k: v for k, v in spec.items() if k not in IGNORED_OPTIONS and v is not False}
+
+
+def _matches(declared, existing):
+    return (list(declared["key"].items()) == [tuple(k) for k in existing["key"]]
+            and _options(declared) == _options(existing))
+
+
+def reconcile_collection(collection, indexes, prune=False):
+    """
+    Make the collection's indexes match the declared IndexModels. Missing indexes are
+    created and ones whose keys or options changed are rebuilt; with prune, indexes
+    that are no longer declared are dropped. Safe to run repeatedly.
+    """
+    report = {"created": [], "rebuilt": [], "dropped": [], "failed": {}}
+    existing = collection.index_information()
+    declared = {index.document["name"]: index for index in indexes}
+
+    for name, index in declared.items():
+        current = existing.get(name)
+        if current is not None and _matches(index.document, current):
+            continue
+        try:
+            if current is not None:
+                collection.drop_index(name)
+            collection.create_indexes([index])
+        except OperationFailure as e:
+            # e.g. duplicate values blocking a unique index, put the old one back and keep going
+            if current is not None:
+                collection.create_indexes([IndexModel(list(current["key"]), name=name, **_options(current))])
+            report["failed"][name] = str(e)
+            continue
+        report["rebuilt" if current is not None else "created"].append(name)
+
+    if prune:
+        for name in existing:
+            if name != "_id_" and name not in declared:
+                collection.drop_index(name)
+                report["dropped"].append(name)
+    return report
+
+
+def reconcile_indexes(db, prune=False):
+    """Reconcile every declared collection, returning a report per collection"""
+    # price_history has to exist as a time-series collection before an index creates it as a plain one
+    ensure_history_collections(db)
+    reports = {}
+    for name, indexes in COLLECTION_INDEXES.items():
+        report = reconcile_collection(db[name], indexes, prune)
+        for index, error in report["failed"].items():
+            print(f"Could not build index {name}.{index}: {error}")
+            if name == "items" and index == "url_name":
+                print("Duplicate url_names block it, run 'python -m core.indexes --dedupe' to keep the newest of each")
+        reports[name] = report
+    return reports
+
+
+def dedupe_items(items):
+    """
+    Deletes all but the most recently updated item per url_name, so the unique url_name
+    index can build on catalogs written before it existed. Returns the deleted _ids.
+    """
+    pipeline = [
+        {"$sort": {"last_updated": -1, "_id": 1}},
+        {"$group": {"_id": "$url_name", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    stale = [item_id for group in items.aggregate(pipeline) for item_id in group["ids"][1:]]
+    if stale:
+        items.delete_many({"_id": {"$in": stale}})
+    return stale
+
+
+def _plan_stages(plan):
+    """Every stage name in an explain plan tree"""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _plan_stages(value)
+
+
+def collscan_report(db):
+    """Explain each hot query and list the ones the planner still answers with a collection scan"""
+    scans = []
+    for collection, description, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        stages = set(_plan_stages(cursor.explain()["queryPlanner"]["winningPlan"]))
+        if "COLLSCAN" in stages:
+            scans.append({"collection": collection, "query": description})
+    return scans
+
+
+if __name__ == "__main__":
+    from core.db import get_database
+
+    parser = argparse.ArgumentParser(description="Reconcile the declared MongoDB indexes")
+    parser.add_argument('--prune', action='store_true', help='Drop indexes that are no longer declared')
+    parser.add_argument('--report', action='store_true', help='List hot queries still running as collection scans')
+    parser.add_argument('--dedupe', action='store_true',
+                        help='Delete all but the newest item per url_name so the unique index can build')
+    args = parser.parse_args()
+
+    db = get_database()
+    if args.dedupe:
+        for item_id in dedupe_items(db["items"]):
+            print(f"Deleted duplicate item {item_id}")
+    for collection, report in reconcile_indexes(db, args.prune).items():
+        print(f"{collection}: {report}")
+    if args.report:
+        scans = collscan_report(db)
+        for scan in scans:
+            print(f"COLLSCAN {scan['collection']}: {scan['query']}")
+        if not scans:
+            print("No hot query runs as a collection scan")
@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+from pymongo import UpdateMany, UpdateOne
+
+
+LISTS_COLLECTION = "lists"
+SUMMARY_ITEM_FIELDS = {"median_price": 1, "volume": 1}
+# price_change adds up the price moves of a list's items since change_since, and
+# starts over from 0 with the first move after this window
+CHANGE_WINDOW = timedelta(hours=24)
+
+
+def empty_summary(now=None):
+    now = now or datetime.utcnow()
+    return {"item_count": 0, "price_total": 0.0, "volume_total": 0.0,
+            "price_change": 0.0, "change_since": now, "updated_at": now}
+
+
+def _price(item):
+    return item.get("median_price") or 0
+
+def _volume(item):
+    return item.get("volume") or 0
+
+
+def summarize(items, now=None):
+    summary = empty_summary(now)
+    summary["item_count"] = len(items)
+    summary["price_total"] = float(sum(_price(item) for item in items))
+    summary["volume_total"] = float(sum(_volume(item) for item in items))
+    return summary
+
+
+def rebuild_summaries(db, query=None):
+    """
+    Recompute the summary of every list matching query from its items, in a read
+    of the lists, a read of their items and one bulk write. New lists start with
+    an empty summary and everything after that is incremental, so this only
+    backfills lists created before summaries existed or repairs drift.
+    """
+    lists = list(db[LISTS_COLLECTION].find(query or {}, {"items": 1}))
+    if not lists:
+        return 0
+    item_ids = {item_id for lst in lists for item_id in lst.get("items") or ()}
+    items = {item["_id"]: item for item in db["items"].find({"_id": {"$in": list(item_ids)}}, SUMMARY_ITEM_FIELDS)}
+    now = datetime.utcnow()
+    db[LISTS_COLLECTION].bulk_write(
+        [UpdateOne({"_id": lst["_id"]}, {"$set": {"summary": summarize(
+            [items[item_id] for item_id in lst.get("items") or () if item_id in items], now)}})
+         for lst in lists], ordered=False)
+    return len(lists)
+
+
+def apply_membership(db, list_id, added=(), removed=()):
+    """Fold items joining and leaving one list into its summary, reading only those items"""
+    changed = list(set(added) | set(removed))
+    if not changed:
+        return
+    totals = {"summary.item_count": 0, "summary.price_total": 0.0, "summary.volume_total": 0.0}
+    for item in db["items"].find({"_id": {"$in": changed}}, SUMMARY_ITEM_FIELDS):
+        sign = 1 if item["_id"] in added else -1
+        totals["summary.item_count"] += sign
+        totals["summary.price_total"] += sign * _price(item)
+        totals["summary.volume_total"] += sign * _volume(item)
+    db[LISTS_COLLECTION].update_one(
+        {"_id": list_id, "summary": {"$exists": True}},
+        {"$inc": totals, "$set": {"summary.updated_at": datetime.utcnow()}})
+
+
+def price_deltas(before, after):
+    """
+    {item_id: (price delta, volume delta)} between two sets of item stats keyed by
+    _id, for items in both whose stats actually moved
+    """
+    deltas = {}
+    for item_id, new in after.items():
+        if (old := before.get(item_id)) is None:
+            continue
+        delta = (_price(new) - _price(old), _volume(new) - _volume(old))
+        if delta != (0, 0):
+            deltas[item_id] = delta
+    return deltas
+
+
+def apply_price_changes(db, deltas, now=None):
+    """
+    Push item stat changes into the summary of every list holding those items. The
+    multikey index on lists.items is the item to lists reverse index, so each item
+    is one indexed UpdateMany and the whole batch is a single bulk write. Returns
+    how many list updates were made.
+    """
+    if not deltas:
+        return 0
+    now = now or datetime.utcnow()
+    # lists whose change window ran out start counting again from this batch
+    operations = [UpdateMany(
+        {"items": {"$in": list(deltas)}, "summary.change_since": {"$lt": now - CHANGE_WINDOW}},
+        {"$set": {"summary.price_change": 0.0, "summary.change_since": now}})]
+    for item_id, (price, volume) in deltas.items():
+        operations.append(UpdateMany(
+            {"items": item_id, "summary": {"$exists": True}},
+            {"$inc": {"summary.price_total": price, "summary.price_change": price, "summary.volume_total": volume},
+             "$set": {"summary.updated_at": now}}))
+    return db[LISTS_COLLECTION].bulk_write(operations, ordered=True).modified_count
+
+
+def apply_item_removed(db, item):
+    """Take a deleted item out of the summaries of the lists still pointing at it, returns how many"""
+    return db[LISTS_COLLECTION].update_many(
+        {"items": item["_id"], "summary": {"$exists": True}},
+        {"$inc": {"summary.item_count": -1, "summary.price_total": -_price(item),
+                  "summary.volume_total": -_volume(item)},
+         "$set": {"summary.updated_at": datetime.utcnow()}}).modified_count
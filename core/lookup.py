@@ -0,0 +1,24 @@
+def items_lookup_pipeline(match, ids_field, as_field="item_details", projection=None):
+    """
+    Aggregation joining the items whose _ids are listed in `ids_field` of the matched
+    documents into `as_field`, in the order of the id list. Ids of deleted items are
+    skipped. The join runs on the items _id index, so any number of documents and
+    items is a single round trip.
+    """
+    lookup = {"from": "items", "localField": ids_field, "foreignField": "_id", "as": as_field}
+    if projection:
+        # MongoDB 5.0+ accepts a pipeline next to localField/foreignField
+        lookup["pipeline"] = [{"$project": projection}]
+    joined = f"${as_field}"
+    return [
+        {"$match": match},
+        {"$lookup": lookup},
+        # $lookup returns matches in index order, put them back in list order
+        {"$addFields": {as_field: {"$map": {
+            "input": {"$filter": {"input": {"$ifNull": [f"${ids_field}", []]}, "as": "id",
+                                  "cond": {"$in": ["$$id", f"{joined}._id"]}}},
+            "as": "id",
+            "in": {"$arrayElemAt": [{"$filter": {"input": joined, "as": "item",
+                                                 "cond": {"$eq": ["$$item._id", "$$id"]}}}, 0]},
+        }}}},
+    ]
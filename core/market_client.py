@@ -0,0 +1,427 @@
+"""
+Shared warframe.market API client used by market.py and the ingestion scripts.
+
+Both clients keep a pooled keep-alive connection (HTTP/2 when the `h2` package
+is installed), retry transient failures with jittered exponential backoff and
+share a circuit breaker that pauses all requests while upstream is degraded.
+Per-endpoint latency and error counters are available from `client.metrics`.
+Pass a `core.http_cache.ResponseCache` as `cache` to reuse responses across runs.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+
+import httpx
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+MARKET_API = "https://api.warframe.market/v1"
+# warframe.market asks clients to stay at or below 3 requests per second
+DEFAULT_RATE = 3.0
+DEFAULT_TIMEOUT = 30
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class MarketAPIError(Exception):
+    """Upstream request failed after retries or returned a malformed payload"""
+    pass
+
+
+def endpoint_name(path):
+    """Collapse a request path into its endpoint template, e.g. /items/x/statistics -> items/{url_name}/statistics"""
+    parts = path.strip("/").split("/")
+    if len(parts) > 1 and parts[0] == "items":
+        parts[1] = "{url_name}"
+    return "/".join(parts)
+
+
+class ClientMetrics:
+    """Per-endpoint request counters and latencies"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def _stats(self, endpoint):
+        return self._endpoints.setdefault(endpoint, {
+            "requests": 0, "errors": 0, "retries": 0, "cache_hits": 0,
+            "total_latency": 0.0, "max_latency": 0.0})
+
+    def record_cache_hit(self, endpoint):
+        with self._lock:
+            self._stats(endpoint)["cache_hits"] += 1
+
+    def record(self, endpoint, latency, error=False, retried=False):
+        with self._lock:
+            stats = self._stats(endpoint)
+            stats["requests"] += 1
+            stats["errors"] += int(error)
+            stats["retries"] += int(retried)
+            stats["total_latency"] += latency
+            stats["max_latency"] = max(stats["max_latency"], latency)
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: {**stats, "avg_latency": round(stats["total_latency"] / max(1, stats["requests"]), 4)}
+                    for endpoint, stats in self._endpoints.items()}
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures. While open every
+    request waits until `reset_timeout` has passed, then exactly one trial
+    request goes through (half open) while the rest keep waiting. The trial's
+    outcome closes the circuit or opens it for another round.
+    """
+
+    # how often callers waiting on a half open circuit check whether the trial finished
+    TRIAL_POLL_INTERVAL = 1.0
+
+    def __init__(self, failure_threshold=5, reset_timeout=60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def wait_time(self):
+        """
+        Seconds to pause before asking again, 0 when this caller may send its request.
+        Callers loop until it returns 0, so everyone re-checks after every pause.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            now = time.monotonic()
+            if self._trial_started is not None:
+                # a trial that never reported back (e.g. cancelled) gives way to a new one
+                if now - self._trial_started < self.reset_timeout:
+                    return min(self.TRIAL_POLL_INTERVAL, self.reset_timeout)
+            elif (remaining := self._opened_at + self.reset_timeout - now) > 0:
+                return remaining
+            # half open: this caller is the trial, everyone else waits for its outcome
+            self._trial_started = now
+            return 0.0
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_started is not None:
+                # the trial failed, open for another round
+                self._opened_at = time.monotonic()
+                self._trial_started = None
+            elif self._failures >= self.failure_threshold and self._opened_at is None:
+                print(f"Circuit breaker opened after {self._failures} failures, pausing for {self.reset_timeout}s")
+                self._opened_at = time.monotonic()
+
+
+class TokenBucket:
+    """
+    Async token bucket rate limiter.
+
+    Tokens refill continuously at `rate` per second up to `capacity`, every
+    upstream request takes one token and waits when the bucket is empty.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _take(self):
+        """Take a token if one is available, otherwise return the seconds until one is"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    async def acquire(self):
+        async with self._lock:
+            while (wait := self._take()) > 0:
+                await asyncio.sleep(wait)
+
+
+class SyncTokenBucket(TokenBucket):
+    """Blocking token bucket for the synchronous client"""
+
+    def __init__(self, rate=DEFAULT_RATE, capacity=None):
+        super().__init__(rate, capacity)
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            while (wait := self._take()) > 0:
+                time.sleep(wait)
+
+
+def backoff_delay(attempt, resp=None):
+    """Full jitter exponential backoff, honouring Retry-After when upstream sends one"""
+    if resp is not None and (retry_after := resp.headers.get("Retry-After", "")).isdigit():
+        return float(retry_after)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def extract_payload(body, url):
+    try:
+        payload = json.loads(body)["payload"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise MarketAPIError(f"Malformed payload from {url}: {e!r}")
+    if not isinstance(payload, dict):
+        raise MarketAPIError(f"Malformed payload from {url}: expected an object")
+    return payload
+
+
+class _BaseMarketClient:
+    def __init__(self, base_url=MARKET_API, max_retries=MAX_RETRIES, breaker=None, cache=None):
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = ClientMetrics()
+        self.cache = cache
+
+    def _cached(self, url, endpoint):
+        """Returns the cache entry for url (or None) and whether it can be served without asking upstream"""
+        entry = self.cache.get(url) if self.cache else None
+        fresh = entry is not None and self.cache.is_fresh(url, entry)
+        if fresh:
+            self.metrics.record_cache_hit(endpoint)
+        return entry, fresh
+
+    def _headers(self, entry):
+        return self.cache.conditional_headers(entry) if entry else {}
+
+    def _result(self, url, resp, entry):
+        if resp.status_code == 304 and entry is not None:
+            self.cache.revalidated(url)
+            return extract_payload(entry.body, url)
+        if resp.is_error:
+            raise MarketAPIError(f"GET {url} returned HTTP {resp.status_code}")
+        payload = extract_payload(resp.content, url)
+        if self.cache:
+            self.cache.put(url, resp.content, resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+        return payload
+
+    def _limits(self, max_connections):
+        return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+
+    def _should_retry(self, resp):
+        return resp.status_code in RETRY_STATUSES
+
+    def _failed(self, path, attempt, error):
+        self.breaker.record_failure()
+        if attempt >= self.max_retries:
+            raise MarketAPIError(f"GET {path} failed after {attempt + 1} attempts: {error}")
+
+
+class MarketClient(_BaseMarketClient):
+    """Blocking client, one pooled connection shared by every call"""
+
+    def __init__(self, rate=DEFAULT_RATE, max_connections=4, timeout=DEFAULT_TIMEOUT, **kwargs):
+        super().__init__(**kwargs)
+        self.limiter = SyncTokenBucket(rate) if rate else None
+        self.http = httpx.Client(http2=HTTP2_AVAILABLE, timeout=timeout,
+                                 limits=self._limits(max_connections))
+
+    def get_payload(self, path):
+        endpoint = endpoint_name(path)
+        url = f"{self.base_url}{path}"
+        entry, fresh = self._cached(url, endpoint)
+        if fresh:
+            return extract_payload(entry.body, url)
+        for attempt in range(self.max_retries + 1):
+            while (pause := self.breaker.wait_time()) > 0:
+                time.sleep(pause)
+            if self.limiter:
+                self.limiter.acquire()
+            start = time.monotonic()
+            try:
+                resp = self.http.get(url, headers=self._headers(entry))
+            except httpx.TransportError as e:
+                self.metrics.record(endpoint, time.monotonic() - start, error=True, retried=attempt > 0)
+                self._failed(path, attempt, e)
+                time.sleep(backoff_delay(attempt))
+                continue
+            failed = self._should_retry(resp)
+            self.metrics.record(endpoint, time.monotonic() - start,
+                                error=failed or resp.is_error, retried=attempt > 0)
+            if failed:
+                self._failed(path, attempt, f"HTTP {resp.status_code}")
+                time.sleep(backoff_delay(attempt, resp))
+                continue
+            self.breaker.record_success()
+            return self._result(url, resp, entry)
+
+    def get_items(self):
+        return self.get_payload("/items")["items"]
+
+    def get_item(self, url_name):
+        return self.get_payload(f"/items/{url_name}")
+
+    def get_statistics(self, url_name):
+        return self.get_payload(f"/items/{url_name}/statistics")
+
+    def get_orders(self, url_name):
+        return self.get_payload(f"/items/{url_name}/orders")
+
+    def close(self):
+        self.http.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncMarketClient(_BaseMarketClient):
+    """Async client used by the ingestion pipeline, rate limited by a shared token bucket"""
+
+    def __init__(self, rate=DEFAULT_RATE, max_connections=8, timeout=DEFAULT_TIMEOUT, **kwargs):
+        super().__init__(**kwargs)
+        self.limiter = TokenBucket(rate) if rate else None
+        self.http = httpx.AsyncClient(http2=HTTP2_AVAILABLE, timeout=timeout,
+                                      limits=self._limits(max_connections))
+
+    async def get_payload(self, path):
+        endpoint = endpoint_name(path)
+        url = f"{self.base_url}{path}"
+        entry, fresh = self._cached(url, endpoint)
+        if fresh:
+            return extract_payload(entry.body, url)
+        for attempt in range(self.max_retries + 1):
+            while (pause := self.breaker.wait_time()) > 0:
+                await asyncio.sleep(pause)
+            if self.limiter:
+                await self.limiter.acquire()
+            start = time.monotonic()
+            try:
+                resp = await self.http.get(url, headers=self._headers(entry))
+            except httpx.TransportError as e:
+                self.metrics.record(endpoint, time.monotonic() - start, error=True, retried=attempt > 0)
+                self._failed(path, attempt, e)
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+            failed = self._should_retry(resp)
+            self.metrics.record(endpoint, time.monotonic() - start,
+                                error=failed or resp.is_error, retried=attempt > 0)
+            if failed:
+                self._failed(path, attempt, f"HTTP {resp.status_code}")
+                await asyncio.sleep(backoff_delay(attempt, resp))
+                continue
+            self.breaker.record_success()
+            return self._result(url, resp, entry)
+
+    async def get_item(self, url_name):
+        return await self.get_payload(f"/items/{url_name}")
+
+    async def get_statistics(self, url_name):
+        return await self.get_payload(f"/items/{url_name}/statistics")
+
+    async def get_orders(self, url_name):
+        return await self.get_payload(f"/items/{url_name}/orders")
+
+    async def aclose(self):
+        await self.http.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+
+# Payload parsing shared by market.py and the ingestion scripts
+
+def get_item_type(tags):
+    if "mod" in tags:
+        return "MOD"
+    if "component" in tags:
+        return "COMPONENT"
+    return "OTHER"
+
+
+def parse_item_info(item, payload):
+    """Merge the /items/{url_name} payload into the item"""
+    url_name = item["url_name"]
+    try:
+        raw_item_info = payload["item"]["items_in_set"][0]
+        item_info = {
+            "thumb": raw_item_info["thumb"],
+            "item_name": raw_item_info["en"]["item_name"],
+            "wiki_link": raw_item_info["en"]["wiki_link"],
+            "market_link": f"https://warframe.market/items/{url_name}",
+            "rarity": raw_item_info.get("rarity", "N/A"),
+            "tags": raw_item_info["tags"],
+            "item_type": get_item_type(raw_item_info["tags"])
+        }
+    except (KeyError, IndexError, TypeError) as e:
+        raise MarketAPIError(f"Malformed item info for {url_name}: {e!r}")
+    item.update(item_info)
+    return item
+
+
+def rank_aggregates(orders):
+    """
+    Mean median price and volume of the statistics rows per mod_rank, in one pass over
+    the rows. Items without ranks are grouped under None.
+    """
+    totals = {}
+    for order in orders:
+        group = totals.setdefault(order.get("mod_rank"), [0, 0.0, 0.0])
+        group[0] += 1
+        group[1] += order["median"]
+        group[2] += order["volume"]
+    return {rank: (round(price / count, 2), round(volume / count, 2))
+            for rank, (count, price, volume) in totals.items()}
+
+
+def parse_item_stats(item, payload, mod_rank=0):
+    """
+    Merge the 48 hour closed statistics from the /items/{url_name}/statistics payload into the item.
+    median_price and volume are those of mod_rank, ranked items also get rank_stats with every rank traded.
+    """
+    try:
+        ranks = rank_aggregates(payload["statistics_closed"]["48hours"])
+    except (KeyError, IndexError, TypeError) as e:
+        raise MarketAPIError(f"Malformed statistics for {item['url_name']}: {e!r}")
+    if None in ranks:
+        median, volume = ranks[None]
+    else:
+        median, volume = ranks.get(mod_rank, (0, 0))
+        # an item that had ranks but no trades this time must not keep the previous refresh's
+        if ranks or "rank_stats" in item:
+            # rank keys are strings since they are stored as Mongo field names
+            item["rank_stats"] = {str(rank): {"median_price": price, "volume": traded}
+                                  for rank, (price, traded) in sorted(ranks.items())}
+    item.update({
+        "median_price": median,
+        "volume": volume,
+        "rank": mod_rank
+    })
+    return item
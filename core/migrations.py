@@ -0,0 +1,25 @@
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+
+def migrate_string_dates(db, collection="items", field="last_updated"):
+    """
+    Converts ISO 8601 strings left in `field` by older write paths to dates. Mongo
+    only compares values of the same type, so a mix breaks range queries and keyset
+    pages on the field. Values that don't parse are reported and left alone.
+    Returns how many documents were converted.
+    """
+    operations, unparsed = [], []
+    for doc in db[collection].find({field: {"$type": "string"}}, {field: 1}):
+        try:
+            operations.append(UpdateOne({"_id": doc["_id"], field: doc[field]},
+                                        {"$set": {field: datetime.fromisoformat(doc[field])}}))
+        except ValueError:
+            unparsed.append(doc["_id"])
+    if unparsed:
+        print(f"Left {len(unparsed)} {collection}.{field} values that aren't ISO dates, e.g. {unparsed[:5]}")
+    if operations:
+        db[collection].bulk_write(operations, ordered=False)
+        print(f"Converted {len(operations)} {collection}.{field} strings to dates")
+    return len(operations)
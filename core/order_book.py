@@ -0,0 +1,93 @@
+from datetime import datetime
+
+import numpy as np
+
+from core.market_client import MarketAPIError
+
+
+# orders priced within this share of the best bid/ask count towards the depth
+DEPTH_BAND = 0.1
+# the price estimate is the median of this many cheapest online sell orders
+FAIR_PRICE_ORDERS = 5
+ONLINE_STATUSES = ("online", "ingame")
+
+
+def parse_orders(item, payload):
+    """
+    Reduce an /items/{url_name}/orders payload to (price, quantity, is_sell) rows of the
+    visible orders from online users, at the item's mod rank when orders carry one.
+    """
+    rank = item.get("rank", 0)
+    try:
+        return [(order["platinum"], order["quantity"], order["order_type"] == "sell")
+                for order in payload["orders"]
+                if order.get("visible", True)
+                and order["user"]["status"] in ONLINE_STATUSES
+                and order.get("mod_rank", rank) == rank]
+    except (KeyError, TypeError) as e:
+        raise MarketAPIError(f"Malformed orders for {item['url_name']}: {e!r}")
+
+
+def _none_where(values, missing):
+    return [None if gone else round(float(value), 2) for value, gone in zip(values, missing)]
+
+
+def order_book_metrics(books, band=DEPTH_BAND, fair_orders=FAIR_PRICE_ORDERS):
+    """
+    Liquidity metrics for many order books at once. `books` is a list with one list of
+    parse_orders rows per item. Every order of every book goes into flat arrays, and each
+    metric is a grouped reduction over them. Returns one dict per book.
+    """
+    n = len(books)
+    sizes = np.fromiter((len(book) for book in books), dtype=np.int64, count=n)
+    rows = np.array([row for book in books for row in book], dtype=np.float64).reshape(-1, 3)
+    owner = np.repeat(np.arange(n), sizes)
+    price, quantity, is_sell = rows[:, 0], rows[:, 1], rows[:, 2].astype(bool)
+    is_buy = ~is_sell
+
+    best_ask = np.full(n, np.inf)
+    np.minimum.at(best_ask, owner[is_sell], price[is_sell])
+    best_bid = np.full(n, -np.inf)
+    np.maximum.at(best_bid, owner[is_buy], price[is_buy])
+    no_asks, no_bids = np.isinf(best_ask), np.isinf(best_bid)
+
+    near_ask = is_sell & (price <= best_ask[owner] * (1 + band))
+    near_bid = is_buy & (price >= best_bid[owner] * (1 - band))
+    ask_depth = np.bincount(owner[near_ask], weights=quantity[near_ask], minlength=n)
+    bid_depth = np.bincount(owner[near_bid], weights=quantity[near_bid], minlength=n)
+    sellers = np.bincount(owner[is_sell], minlength=n)
+    buyers = np.bincount(owner[is_buy], minlength=n)
+
+    # median of the cheapest few asks per book: sort asks by (book, price), then index
+    # into each book's run, a lone troll listing can't drag the estimate around
+    ask_owner, ask_price = owner[is_sell], price[is_sell]
+    order = np.lexsort((ask_price, ask_owner))
+    ask_price = ask_price[order]
+    starts = np.cumsum(sellers) - sellers
+    taken = np.minimum(sellers, fair_orders)
+    low = np.minimum(starts + (taken - 1) // 2, max(len(ask_price) - 1, 0))
+    high = np.minimum(starts + taken // 2, max(len(ask_price) - 1, 0))
+    fair_price = (ask_price[low] + ask_price[high]) / 2 if len(ask_price) else np.zeros(n)
+
+    spread = best_ask - best_bid
+    no_spread = no_asks | no_bids
+    with np.errstate(divide="ignore", invalid="ignore"):
+        spread_pct = np.where(no_spread, 0, spread / best_ask * 100)
+
+    # sent to the bulk endpoint as JSON
+    updated_at = datetime.utcnow().isoformat()
+    columns = {
+        "best_ask": _none_where(best_ask, no_asks),
+        "best_bid": _none_where(best_bid, no_bids),
+        "spread": _none_where(spread, no_spread),
+        "spread_pct": _none_where(spread_pct, no_spread),
+        "fair_price": _none_where(fair_price, no_asks),
+    }
+    return [{**{name: values[i] for name, values in columns.items()},
+             "ask_depth": int(ask_depth[i]),
+             "bid_depth": int(bid_depth[i]),
+             "sellers": int(sellers[i]),
+             "buyers": int(buyers[i]),
+             "depth_band_pct": band * 100,
+             "updated_at": updated_at}
+            for i in range(n)]
@@ -0,0 +1,105 @@
+import base64
+from typing import Literal, Optional
+
+from bson import json_util
+from fastapi import HTTPException, Query, Response, status
+from pymongo import ASCENDING, DESCENDING
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+SORT_FIELDS = ("item_name", "median_price", "volume", "last_updated")
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# computed sort values are added to the documents under this name while paging
+SORT_KEY_FIELD = "_sort_key"
+
+SortField = Literal["item_name", "median_price", "volume", "last_updated"]
+SortOrder = Literal["asc", "desc"]
+
+
+class PageParams:
+    """Query parameters shared by every paginated item listing"""
+
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Page size"),
+        sort: SortField = Query("item_name", description="Field to sort on"),
+        order: SortOrder = Query("asc"),
+        next: Optional[str] = Query(None, description=f"Cursor from the {NEXT_CURSOR_HEADER} header of the previous page"),
+    ):
+        self.limit = limit
+        self.sort = sort
+        self.order = order
+        self.next = next
+
+
+def encode_cursor(sort, doc):
+    raw = json_util.dumps([sort, doc.get(sort), doc["_id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(token, sort):
+    try:
+        cursor_sort, value, last_id = json_util.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid page cursor")
+    if cursor_sort != sort:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Page cursor was issued for a different sort")
+    return value, last_id
+
+
+def keyset_filter(query, page):
+    """Restrict query to the documents after the page cursor in (sort field, _id) order"""
+    if not page.next:
+        return query
+    value, last_id = decode_cursor(page.next, page.sort)
+    op = "$gt" if page.order == "asc" else "$lt"
+    after = {"$or": [{page.sort: {op: value}}, {page.sort: value, "_id": {op: last_id}}]}
+    return {"$and": [query, after]} if query else after
+
+
+def paginate(collection, query, page, response: Response, projection=None, sort_key=None):
+    """
+    Returns one page of documents matching query, sorted by the page's sort
+    field with _id as tie breaker. When more documents follow, the cursor for
+    the next page is set in the X-Next-Cursor response header.
+
+    `sort_key` is an optional (name, aggregation expression) pair to sort on instead
+    of the stored field, see paginate_computed.
+    """
+    if sort_key is not None:
+        return paginate_computed(collection, query, page, response, projection, *sort_key)
+    direction = ASCENDING if page.order == "asc" else DESCENDING
+    cursor = (collection.find(keyset_filter(query, page), projection)
+              .sort([(page.sort, direction), ("_id", direction)])
+              .limit(page.limit + 1))
+    docs = list(cursor)
+    if len(docs) > page.limit:
+        docs = docs[:page.limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(page.sort, docs[-1])
+    return docs
+
+
+def paginate_computed(collection, query, page, response: Response, projection, name, expression):
+    """
+    Like paginate, but sorted on a value computed per document (e.g. one mod rank's
+    price), so it runs as an aggregation. `name` labels the cursors, a cursor from
+    another sort key is rejected. The expression must never evaluate to null.
+    """
+    direction = ASCENDING if page.order == "asc" else DESCENDING
+    pipeline = [{"$match": query}, {"$addFields": {SORT_KEY_FIELD: expression}}]
+    if page.next:
+        value, last_id = decode_cursor(page.next, name)
+        op = "$gt" if page.order == "asc" else "$lt"
+        pipeline.append({"$match": {"$or": [{SORT_KEY_FIELD: {op: value}},
+                                            {SORT_KEY_FIELD: value, "_id": {op: last_id}}]}})
+    pipeline += [{"$sort": {SORT_KEY_FIELD: direction, "_id": direction}}, {"$limit": page.limit + 1}]
+    if projection:
+        pipeline.append({"$project": {**projection, SORT_KEY_FIELD: 1}})
+    docs = list(collection.aggregate(pipeline))
+    if len(docs) > page.limit:
+        docs = docs[:page.limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(name, {name: docs[-1][SORT_KEY_FIELD], "_id": docs[-1]["_id"]})
+    for doc in docs:
+        del doc[SORT_KEY_FIELD]
+    return docs
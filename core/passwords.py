@@ -0,0 +1,77 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+from fastapi import HTTPException, status
+
+from core.config import get_int
+
+
+# bcrypt is deliberately slow (~100ms+ at the default 12 rounds), so hashing runs on a
+# process pool instead of the event loop and scales across cores
+BCRYPT_ROUNDS = get_int("BCRYPT_ROUNDS", 12)
+PASSWORD_WORKERS = get_int("PASSWORD_WORKERS", os.cpu_count() or 1)
+# hashes queued or running beyond this are rejected straight away rather than
+# letting every login behind them wait
+PASSWORD_QUEUE_LIMIT = get_int("PASSWORD_QUEUE_LIMIT", PASSWORD_WORKERS * 4)
+RETRY_AFTER_SECONDS = 1
+
+_executor = None
+_in_flight = 0
+
+
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    salt = bcrypt.gensalt(rounds)
+    hashed_password = bcrypt.hashpw(password.encode("utf-8"), salt)
+    return hashed_password.decode("utf-8")
+
+
+# Verify password function
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
+
+
+def get_executor():
+    """The password hashing pool, started on first use so importing this module never forks"""
+    global _executor
+    if _executor is None:
+        # the API process runs the db pool and mongo monitor threads, and forking it can copy
+        # a lock one of them holds; workers come from a clean forkserver (spawn where missing)
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _executor = ProcessPoolExecutor(max_workers=PASSWORD_WORKERS, mp_context=multiprocessing.get_context(method))
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+async def _run_limited(fn, *args):
+    global _in_flight
+    if _in_flight >= PASSWORD_QUEUE_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts in progress, try again shortly",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+    _in_flight += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), fn, *args)
+    finally:
+        _in_flight -= 1
+
+
+async def hash_password_async(password: str) -> str:
+    """Hash a password on the process pool, raising 503 when the pool is saturated"""
+    return await _run_limited(hash_password, password, BCRYPT_ROUNDS)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Check a password on the process pool, raising 503 when the pool is saturated"""
+    return await _run_limited(verify_password, plain_password, hashed_password)
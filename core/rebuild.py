@@ -0,0 +1,28 @@
+import time
+
+
+# in-memory indexes are rebuilt from Mongo at most this often, to pick up writes made by other workers
+REBUILD_INTERVAL = 600
+
+
+class PeriodicRebuild:
+    """
+    Base for in-memory indexes loaded whole from Mongo and kept current by their own
+    writes. build(source) replaces the contents and calls mark_built(), ensure_built
+    runs it when the index was never built or is older than REBUILD_INTERVAL.
+    """
+
+    built_at = None
+
+    def build(self, source):
+        raise NotImplementedError
+
+    def mark_built(self):
+        self.built_at = time.monotonic()
+
+    def is_stale(self):
+        return self.built_at is None or time.monotonic() - self.built_at > REBUILD_INTERVAL
+
+    def ensure_built(self, source):
+        if self.is_stale():
+            self.build(source)
@@ -0,0 +1,186 @@
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+from heapq import nsmallest
+from operator import attrgetter
+
+from core.rebuild import PeriodicRebuild
+
+
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 50
+# fuzzy matches need at least this share of the query's trigrams in the item name
+MIN_SIMILARITY = 0.5
+# past this many candidates only the best by a cheap pre-rank get the full score
+MAX_SCORED = 100
+# recent results are memoized until the next write, keystrokes repeat the same short prefixes a lot
+MAX_MEMOIZED = 1024
+SUGGEST_PROJECTION = {"url_name": 1, "item_name": 1, "tags": 1, "item_type": 1}
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text):
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _Entry:
+    __slots__ = ("doc", "name", "length", "name_tokens", "tag_tokens", "grams")
+
+    def __init__(self, doc):
+        self.doc = {"_id": doc["_id"], "url_name": doc["url_name"],
+                    "item_name": doc.get("item_name", ""), "item_type": doc.get("item_type")}
+        self.name = normalize(self.doc["item_name"])
+        self.length = len(self.name)
+        self.name_tokens = set(self.name.split())
+        self.tag_tokens = {token for tag in doc.get("tags") or () for token in normalize(tag).split()}
+        self.grams = trigrams(self.name)
+
+
+class SuggestIndex(PeriodicRebuild):
+    """
+    In-memory autocomplete index over item names and tags, keyed by item _id.
+
+    Every word of a name or tag is kept in a sorted list so prefix lookups are
+    a bisect, and name trigrams give typo tolerant matches when the prefixes
+    run out. Items are added and removed one at a time as they are written.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._words = []  # sorted (word, _id) pairs
+        self._grams = defaultdict(set)
+        self._memo = {}
+
+    def build(self, collection):
+        """Replace the whole index with every item of the collection"""
+        docs = collection.find({}, SUGGEST_PROJECTION)
+        with self._lock:
+            self._entries.clear()
+            self._words.clear()
+            self._grams.clear()
+            for doc in docs:
+                self._add(_Entry(doc))
+            self.mark_built()
+
+    def upsert(self, doc):
+        """Add or replace one item, a no-op before the first build since that reads everything anyway"""
+        with self._lock:
+            if self.built_at is not None:
+                self._remove(str(doc["_id"]))
+                self._add(_Entry(doc))
+
+    def remove(self, item_id):
+        with self._lock:
+            self._remove(str(item_id))
+
+    def refresh(self, collection, url_names):
+        """Re-read the items with the given url_names from Mongo, e.g. after a bulk write"""
+        if self.built_at is None:
+            return
+        for doc in collection.find({"url_name": {"$in": list(url_names)}}, SUGGEST_PROJECTION):
+            self.upsert(doc)
+
+    def _add(self, entry):
+        key = str(entry.doc["_id"])
+        self._memo.clear()
+        self._entries[key] = entry
+        for word in entry.name_tokens | entry.tag_tokens:
+            insort(self._words, (word, key))
+        for gram in entry.grams:
+            self._grams[gram].add(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._memo.clear()
+        for word in entry.name_tokens | entry.tag_tokens:
+            i = bisect_left(self._words, (word, key))
+            if i < len(self._words) and self._words[i] == (word, key):
+                del self._words[i]
+        for gram in entry.grams:
+            keys = self._grams.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._grams[gram]
+
+    def _prefixed(self, prefix):
+        """ids of the items with a name or tag word starting with prefix"""
+        lo = bisect_left(self._words, (prefix,))
+        hi = bisect_left(self._words, (prefix + "\uffff",), lo)
+        return {key for _, key in self._words[lo:hi]}
+
+    def _score(self, entry, query, tokens, grams):
+        if entry.name == query:
+            return 100.0
+        score = 0.0
+        if entry.name.startswith(query):
+            score += 50
+        for token in tokens:
+            if any(word.startswith(token) for word in entry.name_tokens):
+                score += 10
+            elif any(word.startswith(token) for word in entry.tag_tokens):
+                score += 4
+        shared = len(grams & entry.grams)
+        score += 20 * shared / (len(grams) + len(entry.grams) - shared)
+        # shorter names first among otherwise equal matches
+        return score - len(entry.name) / 100
+
+    def search(self, query, limit=DEFAULT_SUGGESTIONS, item_type=None):
+        """Ranked suggestions for query: prefix matches first, then fuzzy trigram matches"""
+        query = normalize(query)
+        if not query:
+            return []
+        memo_key = (query, limit, item_type)
+        with self._lock:
+            if (results := self._memo.get(memo_key)) is not None:
+                return results
+            results = self._search(query, limit, item_type)
+            if len(self._memo) >= MAX_MEMOIZED:
+                self._memo.clear()
+            self._memo[memo_key] = results
+            return results
+
+    def _search(self, query, limit, item_type):
+        tokens = query.split()
+        grams = trigrams(query)
+        # every query word has to prefix some name or tag word
+        candidates = None
+        for token in tokens:
+            keys = self._prefixed(token)
+            candidates = keys if candidates is None else candidates & keys
+        candidates = candidates or set()
+
+        if len(candidates) < limit:
+            counts = defaultdict(int)
+            for gram in grams:
+                for key in self._grams.get(gram, ()):
+                    counts[key] += 1
+            # most of the query's trigrams have to appear in the name
+            candidates.update(key for key, shared in counts.items() if shared / len(grams) >= MIN_SIMILARITY)
+
+        entries = [self._entries[key] for key in candidates]
+        if item_type:
+            entries = [entry for entry in entries if entry.doc["item_type"] == item_type]
+        if len(entries) > MAX_SCORED:
+            # short prefixes match a large part of the catalog, names starting with the query and short names win
+            heads = [entry for entry in entries if entry.name.startswith(query)]
+            rest = [entry for entry in entries if not entry.name.startswith(query)] if len(heads) < MAX_SCORED else []
+            entries = nsmallest(MAX_SCORED, heads, key=attrgetter("length"))
+            entries += nsmallest(MAX_SCORED - len(entries), rest, key=attrgetter("length"))
+        scored = [(self._score(entry, query, tokens, grams), entry.doc) for entry in entries]
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return [{**doc, "score": round(score, 2)} for score, doc in scored[:limit]]
+
+
+# Singleton instance backing /item/suggest
+suggest_index = SuggestIndex()
@@ -1,22 +1,36 @@
 from fastapi import FastAPI
-from dotenv import dotenv_values
-from pymongo import MongoClient
 
+from core.indexes import reconcile_indexes
+from core.list_summary import rebuild_summaries
+from core.migrations import migrate_string_dates
+from core.db import close_client, db_executor, get_client, get_database, pool_monitor
+from core.passwords import shutdown_executor as shutdown_password_executor
 
 
-config = dotenv_values(".env")
 
 app = FastAPI()
 
 @app.on_event("startup")
 def startup_db_client():
-    app.mongodb_client = MongoClient(config["ATLAS_URI"])
-    app.database = app.mongodb_client[config["DB_NAME"]]
+    app.mongodb_client = get_client()
+    app.database = get_database()
+    reconcile_indexes(app.database)
+    # items created through POST /item used to store last_updated as a string
+    migrate_string_dates(app.database)
+    # lists created before summaries existed get one once
+    rebuild_summaries(app.database, {"summary": {"$exists": False}})
     print("Connected to the MongoDB database!")
 
 @app.on_event("shutdown")
 def shutdown_db_client():
-    app.mongodb_client.close()
+    db_executor.shutdown(wait=True)
+    shutdown_password_executor()
+    close_client()
+
+@app.get("/pool-stats")
+def pool_stats():
+    """Connection pool checkout counts and wait times, for sizing MONGO_MAX_POOL_SIZE"""
+    return pool_monitor.stats()
 
 
 def get_users_collection():
@@ -32,6 +46,8 @@ def get_lists_collection():
 from routers.item_router import router as item_router
 from routers.user_router import router as user_router
 from routers.lists_router import router as lists_router
+from routers.analytics_router import router as analytics_router
 app.include_router(item_router, tags=["items"], prefix="/item")
 app.include_router(user_router, tags=["users"], prefix="/user")
-app.include_router(lists_router, tags=["lists"], prefix="/lists")
\ No newline at end of file
+app.include_router(lists_router, tags=["lists"], prefix="/lists")
+app.include_router(analytics_router, tags=["analytics"], prefix="/analytics")
\ No newline at end of file
@@ -1,19 +1,24 @@
-import json
 import requests
-import statistics
 import datetime
 
 from bson import json_util
 
+from core.http_cache import DEFAULT_CACHE_PATH, ResponseCache
+from core.market_client import MarketAPIError, MarketClient, parse_item_info, parse_item_stats
+
 
 
-ITEMS_FILE = "items.json"
-ITEM_INFO_FILE = "item_info.json"
-ITEM_STATS_FILE = "item_stats.json"
 TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.00Z"
+# every upstream response is cached on disk per URL, so a rerun only re-fetches
+# what has expired (item info after a week, statistics after an hour) or changed
+_market = None
 
-class ItemFileException(Exception):
-    pass
+def get_market():
+    """The shared client, created on first use so importing this module doesn't open the cache file"""
+    global _market
+    if _market is None:
+        _market = MarketClient(cache=ResponseCache(DEFAULT_CACHE_PATH))
+    return _market
 
 def add_item(data):
     data["last_updated"] = datetime.datetime.now().strftime(TIME_FORMAT)
@@ -24,48 +29,28 @@ def add_item(data):
     # print(resp)
     return resp
 
-def get_item_type(tags):
-    if "mod" in tags:
-        return "MOD"
-    if "component" in tags:
-        return "COMPONENT"
-    return "OTHER"
-
-def write_to_file(data, file):
-    print(f"Writing items to file {file}")
-    with open (file, 'w') as f:
-        json.dump(data, f)
-
-def get_from_file(file):
-    try:
-        with open(file, 'r') as f:
-            items = json.load(f)
-        return items
-    except Exception as e:
-        raise ItemFileException(f"Could not open file: {file}")
-
 
 def get_items_from_web(limit_returned=None):
     print("Getting items list from web")
-    items = requests.get("https://api.warframe.market/v1/items").json();
-    return items["payload"]["items"][0:limit_returned]
-
-def get_items_from_file(file = ITEMS_FILE, limit=None):
-    items = get_from_file(file)[0:limit]
-    return items
-
-def get_items(limit=None, file = ITEMS_FILE):
-    """Attempts to get the items list from file, then pulls them from the web and writes the file if there's an error"""
-    try: 
-        items = get_items_from_file(file, limit)
-    except ItemFileException as e:
-        print(f"There was an issue reading from the items file: {e}.")
-        items = get_items_from_web(limit)
-        write_to_file(items, file)
-    return items
+    items = get_market().get_items()
+    return items[0:limit_returned]
+
+def get_items(limit=None):
+    """Gets the items list, served from the response cache while it is fresh"""
+    return get_items_from_web(limit)
+
+def _skip_failures(fetch, items):
+    """Apply fetch to every item, dropping (and reporting) the ones upstream could not serve"""
+    results = []
+    for item in items:
+        try:
+            results.append(fetch(item))
+        except MarketAPIError as e:
+            print(f"Skipping {item.get('url_name')}: {e}")
+    return results
 
 def get_items_info_from_web(items):
-    return [get_item_info_from_web(item) for item in items]
+    return _skip_failures(get_item_info_from_web, items)
 
 
 def get_item_info_from_web(item = None, item_url = None):
@@ -74,84 +59,36 @@ def get_item_info_from_web(item = None, item_url = None):
         if not item:
             raise Exception("no item or item_url provided")
         item_url = item["url_name"]
-    raw_item_info = requests.get(f"https://api.warframe.market/v1/items/{item_url}").json()["payload"]["item"]["items_in_set"][0]
-    item_info = {
-        "thumb": raw_item_info["thumb"],
-        "item_name": raw_item_info["en"]["item_name"],
-        "wiki_link": raw_item_info["en"]["wiki_link"],
-        "market_link": f"https://warframe.market/items/{item_url}",
-        "rarity": raw_item_info.get("rarity", "N/A"),
-        "tags": raw_item_info["tags"],
-        "item_type": get_item_type(raw_item_info["tags"])
-        }
-    item.update(item_info)
-    return item
-
-
-def get_items_info_from_file(file = ITEM_INFO_FILE):
-    items_info = get_from_file(file)
-    return items_info
-
-
-def get_items_info(items, file = ITEM_INFO_FILE):
-    """Attempt to read items info from file, if not update the items list passed in. NOTE: this will overwrite any existing data"""
-    try:
-        items_info = get_items_info_from_file()
-    except ItemFileException as e:
-        print(f"There was an issue read from the item info file: {e}")
-        items_info = get_items_info_from_web(items)
-        write_to_file(items_info, file)
-    return items_info
+    if not item:
+        item = {"url_name": item_url}
+    return parse_item_info(item, get_market().get_item(item_url))
+
+
+def get_items_info(items):
+    """Adds the item info to each item in the list passed in. NOTE: this will overwrite any existing data"""
+    return get_items_info_from_web(items)
 
 def get_item_stats_from_web(items):
-    return [get_item_stat_from_web(item) for item in items]
+    return _skip_failures(get_item_stat_from_web, items)
 
 def get_item_stat_from_web(item, mod_rank = 0):
-    raw_item_order_info = requests.get(f"https://api.warframe.market/v1/items/{item['url_name']}/statistics").json()["payload"]["statistics_closed"]["48hours"]
-    median = 0
-    volume = 0
-
-    if len(raw_item_order_info) > 0:
-        if "mod_rank" in raw_item_order_info[0]:
-            filtered_order_info = [order for order in raw_item_order_info if order["mod_rank"] == mod_rank]
-        else:
-            filtered_order_info = raw_item_order_info
-
-        if filtered_order_info:
-            median = statistics.mean([order["median"] for order in filtered_order_info])
-            volume = statistics.mean([order["volume"] for order in filtered_order_info])
-
-    item_order_info = {
-            "median_price" : round(median, 2),
-            "volume" : round(volume, 2),
-            "rank" : mod_rank
-    }
-    item.update(item_order_info)
-    return item
-
+    return parse_item_stats(item, get_market().get_statistics(item["url_name"]), mod_rank)
 
-def get_item_stats_from_file(file = ITEM_STATS_FILE):
-    return get_from_file(file)
 
-def get_item_stats(items, file = ITEM_STATS_FILE):
-    """Attempt to read items stats from file, if not update the items list passed in. NOTE: this will overwrite any existing data"""
-    try:
-        item_stats = get_item_stats_from_file(file)
-    except ItemFileException as e:
-        print(f"There was an issue reading the item stats from file: {e}")
-        item_stats = get_item_stats_from_web(items)
-        write_to_file(item_stats, file)
-    return item_stats
+def get_item_stats(items):
+    """Adds the item stats to each item in the list passed in. NOTE: this will overwrite any existing data"""
+    return get_item_stats_from_web(items)
 
 
 # todo implement some filtering to just get mods or prime parts etc
-def get_all_item_objects(limit = None, item_file = ITEMS_FILE, items_info_file = ITEM_INFO_FILE, items_stats_file = ITEM_STATS_FILE):
+def get_all_item_objects(limit = None):
     print("TOP: getting items")
-    items = get_items(limit, item_file)
+    items = get_items(limit)
     print("TOP: getting items info")
-    items_info = get_items_info(items, items_info_file)
+    items_info = get_items_info(items)
     print("TOP: getting items stats")
-    items_stats = get_item_stats(items_info, items_stats_file)
+    items_stats = get_item_stats(items_info)
+    print(f"Upstream requests: {get_market().metrics.snapshot()}")
     # return items
     # return items_info
     return items_stats
@@ -0,0 +1,29 @@
+from datetime import datetime
+from typing import Literal, Optional
+from pydantic import BaseModel
+from pymongo import IndexModel, ASCENDING, DESCENDING
+
+Resolution = Literal["raw", "hour", "day", "week"]
+
+PRICE_HISTORY_INDEXES = [
+    # one item's points newest first, also what the time-series buckets are clustered on
+    IndexModel([("item_id", ASCENDING), ("ts", DESCENDING)], name="item_id_ts"),
+]
+
+PRICE_ROLLUP_INDEXES = [
+    # one bucket per item, resolution and bucket start, upserted by every stats refresh
+    IndexModel([("item_id", ASCENDING), ("resolution", ASCENDING), ("start", DESCENDING)],
+               name="item_id_resolution_start", unique=True),
+]
+
+
+class PricePoint(BaseModel):
+    """One price history point, either a raw stats refresh or an aggregated bucket"""
+    ts: datetime
+    median_price: float # the refresh's median, or the mean of the bucket's medians
+    volume: float # the refresh's volume, or the mean of the bucket's volumes
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    open: Optional[float] = None
+    close: Optional[float] = None
+    samples: int = 1
@@ -1,13 +1,83 @@
 import uuid
-from typing import List, Optional
-from pydantic import BaseModel, Field
+from functools import lru_cache
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field, create_model, model_validator
+from pymongo import IndexModel, ASCENDING
 from datetime import datetime
 
+ITEM_INDEXES = [
+    # stats refresh scheduling selects stale items by last_updated, also the last_updated sort
+    IndexModel([("last_updated", ASCENDING), ("_id", ASCENDING)], name="last_updated_id"),
+    # new item discovery reads url_names straight from this index, bulk upserts match on it
+    IndexModel([("url_name", ASCENDING)], name="url_name", unique=True),
+    # arcane lookups match on tags (multikey)
+    IndexModel([("tags", ASCENDING)], name="tags"),
+    # keyset pagination, every listing sorts on one of these fields with _id as tie breaker
+    *[IndexModel([(field, ASCENDING), ("_id", ASCENDING)], name=f"{field}_id")
+      for field in ("item_name", "median_price", "volume")],
+    *[IndexModel([("item_type", ASCENDING), (field, ASCENDING), ("_id", ASCENDING)], name=f"item_type_{field}_id")
+      for field in ("item_name", "median_price", "volume", "last_updated")],
+]
+
 class Filter(BaseModel):
     property_name: str
     search_term: str
     wildcard: bool
 
+class ItemQuery(BaseModel):
+    """
+    Structured item query, every condition is optional and they are ANDed together.
+    Only these fields can be filtered on, anything else in the body is rejected.
+    """
+    item_type: Optional[str] = None
+    rarity: Optional[List[str]] = None
+    tags_all: Optional[List[str]] = None # item has every one of these tags
+    tags_any: Optional[List[str]] = None # item has at least one of these tags
+    min_price: Optional[float] = Field(None, ge=0)
+    max_price: Optional[float] = Field(None, ge=0)
+    min_volume: Optional[float] = Field(None, ge=0)
+    max_volume: Optional[float] = Field(None, ge=0)
+    max_age_hours: Optional[float] = Field(None, gt=0) # only items refreshed within this many hours
+    rank: Optional[int] = Field(None, ge=0) # price and volume ranges apply to this mod rank
+
+    @model_validator(mode="after")
+    def check_ranges(self):
+        for low, high in (("min_price", "max_price"), ("min_volume", "max_volume")):
+            if getattr(self, low) is not None and getattr(self, high) is not None and getattr(self, low) > getattr(self, high):
+                raise ValueError(f"{low} must not be greater than {high}")
+        return self
+
+    class Config:
+        extra = "forbid"
+        schema_extra = {
+            "example": {
+                "item_type": "MOD",
+                "rarity": ["rare", "legendary"],
+                "min_price": 10,
+                "max_price": 50,
+                "min_volume": 5,
+                "max_age_hours": 24,
+            }
+        }
+
+class RankStats(BaseModel):
+    median_price: float
+    volume: float
+
+class OrderBookStats(BaseModel):
+    """Live liquidity from the current online orders, refreshed by the optional orders ingestion stage"""
+    best_ask: Optional[float] = None
+    best_bid: Optional[float] = None
+    spread: Optional[float] = None
+    spread_pct: Optional[float] = None
+    fair_price: Optional[float] = None # median of the cheapest online sell orders
+    ask_depth: int = 0 # quantity listed within depth_band_pct of the best ask
+    bid_depth: int = 0 # quantity wanted within depth_band_pct of the best bid
+    sellers: int = 0
+    buyers: int = 0
+    depth_band_pct: float
+    updated_at: datetime
+
 class Item(BaseModel):
     id: str = Field(default_factory=uuid.uuid4, alias="_id")
     url_name: str = Field(...)
@@ -22,6 +92,9 @@ class Item(BaseModel):
     rarity: str = Field(...)
     tags: List[str] = Field(...)
     item_type: str = Field(...) # MOD or COMPONENT
+    price_volatility: Optional[float] = None # smoothed relative price change between refreshes
+    rank_stats: Optional[Dict[str, RankStats]] = None # stats per mod rank traded, keyed by rank
+    order_book: Optional[OrderBookStats] = None
 
     class Config:
         allow_population_by_field_name = True
@@ -43,6 +116,14 @@ class Item(BaseModel):
         }
 
 
+@lru_cache(maxsize=128)
+def item_fields_model(fields):
+    """Response model with only the given Item fields (a sorted tuple of field names), used for sparse fieldsets"""
+    return create_model(
+        f"Item[{','.join(fields)}]",
+        **{name: (Item.model_fields[name].annotation, Item.model_fields[name]) for name in fields})
+
+
 class ItemUpdate(BaseModel):
     url_name: Optional[str] = None
     thumb: Optional[str] = None
@@ -56,6 +137,9 @@ class ItemUpdate(BaseModel):
     rarity: Optional[str] = None
     tags: Optional[List[str]] = None 
     item_type: Optional[str] = None
+    price_volatility: Optional[float] = None
+    rank_stats: Optional[Dict[str, RankStats]] = None
+    order_book: Optional[OrderBookStats] = None
 
     class Config:
         allow_population_by_field_name = True
@@ -76,3 +160,17 @@ class ItemUpdate(BaseModel):
             }
         }
 
+
+
+class BulkItemResult(BaseModel):
+    url_name: Optional[str] = None
+    status: str # inserted, updated, failed, invalid or duplicate
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BulkUpsertResponse(BaseModel):
+    inserted: int = 0
+    updated: int = 0
+    failed: int = 0
+    results: List[BulkItemResult] = Field(default_factory=list)
@@ -1,12 +1,19 @@
 from datetime import datetime
 from typing import Any, List, Optional
-from pydantic import BaseModel, Field, GetCoreSchemaHandler, GetJsonSchemaHandler
+from pydantic import BaseModel, Field, GetCoreSchemaHandler, GetJsonSchemaHandler, computed_field
 from bson import ObjectId
 from pymongo import IndexModel, ASCENDING
 import uuid
 from pydantic_core import core_schema
 from pydantic.json_schema import JsonSchemaValue
 
+LIST_INDEXES = [
+    # a user's lists, and every _id lookup is also scoped by owner
+    IndexModel([("owner_id", ASCENDING), ("_id", ASCENDING)], name="owner_id_id"),
+    # multikey, the item -> lists reverse index for pushing price changes into list summaries
+    IndexModel([("items", ASCENDING)], name="items"),
+]
+
 class PyObjectId(ObjectId):
     @classmethod
     def __get_pydantic_core_schema__(
@@ -86,7 +93,23 @@ class ListUpdate(BaseModel):
     add_items: Optional[List[str]] = None
     remove_items: Optional[List[str]] = None
 
+class ListSummary(BaseModel):
+    """Valuation of a list, kept up to date as its items and their prices change"""
+    item_count: int = 0
+    price_total: float = 0
+    volume_total: float = 0
+    # sum of the items' price moves since change_since (at most a day ago)
+    price_change: float = 0
+    change_since: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    @computed_field
+    @property
+    def price_avg(self) -> float:
+        return round(self.price_total / self.item_count, 2) if self.item_count else 0.0
+
 class ListResponse(ListDB):
     """Response model with cleaned data"""
     id: PyObjectId = Field(alias="_id")
+    summary: Optional[ListSummary] = None
     # pass
\ No newline at end of file
@@ -1,6 +1,15 @@
 from datetime import datetime
 from typing import List, Optional
 from pydantic import BaseModel, EmailStr
+from pymongo import IndexModel, ASCENDING
+
+USER_INDEXES = [
+    # register checks both for duplicates and login/auth look users up by email
+    IndexModel([("email", ASCENDING)], name="email", unique=True),
+    IndexModel([("username", ASCENDING)], name="username", unique=True),
+    # the price alert engine loads the users that opted in
+    IndexModel([("notifications.email_alerts", ASCENDING)], name="notifications_email_alerts"),
+]
 
 class Filters(BaseModel):
     min_price: Optional[float] = None
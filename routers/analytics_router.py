@@ -0,0 +1,53 @@
+from typing import Literal, Optional
+from fastapi import APIRouter, HTTPException, Query, Request, status
+
+from core.analytics import (DEFAULT_MOVERS, DEFAULT_PERIODS, DEFAULT_SPAN, DEFAULT_WINDOW, MAX_PERIODS,
+                            load_snapshot, metric_rows, top_movers, trend_metrics)
+from core.cache import item_cache
+from routers.item_router import ALL_TYPES_TAG
+
+router = APIRouter()
+
+Metric = Literal["pct_change", "volatility", "ema", "vwap", "volume", "price"]
+Direction = Literal["up", "down", "abs"]
+SnapshotResolution = Literal["hour", "day", "week"]
+
+
+def get_snapshot(request, resolution, periods):
+    """The columnar snapshot, cached like item reads and dropped by any item or stats write"""
+    key = ("analytics-snapshot", resolution, periods)
+    return item_cache.get_or_load(key, lambda: load_snapshot(request.app.database, resolution, periods), (ALL_TYPES_TAG,))
+
+def check_window(window, periods):
+    if window >= periods:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="window must be smaller than periods")
+
+
+@router.get("/trends", response_description="EMA, volatility, percent change and VWAP of every item")
+def trends(request: Request, item_type: Optional[str] = None, resolution: SnapshotResolution = "day",
+           periods: int = Query(DEFAULT_PERIODS, ge=2, le=MAX_PERIODS, description="Buckets of history to load"),
+           span: int = Query(DEFAULT_SPAN, ge=1, description="EMA span in buckets"),
+           window: int = Query(DEFAULT_WINDOW, ge=1, description="Buckets for volatility, percent change, VWAP and volume")):
+    check_window(window, periods)
+    snapshot = get_snapshot(request, resolution, periods)
+    mask = snapshot.select(item_type)
+    return metric_rows(snapshot, mask, trend_metrics(snapshot, mask, span, window))
+
+@router.get("/movers", response_description="Top N items by a trend metric")
+def movers(request: Request, metric: Metric = "pct_change", direction: Direction = "up",
+           n: int = Query(DEFAULT_MOVERS, ge=1, le=500), item_type: Optional[str] = None,
+           min_volume: float = Query(0, ge=0, description="Ignore items that traded less than this over the window"),
+           resolution: SnapshotResolution = "day",
+           periods: int = Query(DEFAULT_PERIODS, ge=2, le=MAX_PERIODS),
+           span: int = Query(DEFAULT_SPAN, ge=1),
+           window: int = Query(DEFAULT_WINDOW, ge=1)):
+    check_window(window, periods)
+    snapshot = get_snapshot(request, resolution, periods)
+    mask = snapshot.select(item_type)
+    metrics = trend_metrics(snapshot, mask, span, window)
+    if min_volume:
+        # thinly traded items swing the most, keep them out of the ranking
+        keep = metrics["volume"] >= min_volume
+        mask[mask] = keep
+        metrics = {name: values[keep] for name, values in metrics.items()}
+    return metric_rows(snapshot, mask, metrics, top_movers(metrics[metric], n, direction))
@@ -1,57 +1,299 @@
-from fastapi import APIRouter, Body, Request, Response, HTTPException, status
+from fastapi import APIRouter, Body, Depends, Query, Request, Response, HTTPException, status
 from fastapi.encoders import jsonable_encoder
-from typing import List
-
-from models.itemModels import Item, ItemUpdate, Filter
+from fastapi.responses import StreamingResponse
+from bson import json_util
+import re
+from functools import lru_cache
+from pydantic import TypeAdapter, ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from typing import List, Optional
+from datetime import datetime, timedelta
+
+from models.historyModels import PricePoint, Resolution
+from models.itemModels import Item, ItemUpdate, Filter, ItemQuery, BulkItemResult, BulkUpsertResponse, item_fields_model
+from core.pagination import NEXT_CURSOR_HEADER, PageParams, paginate
+from core.export import EXPORT_BATCH_SIZE, ndjson_stream
+from core.cache import item_cache
+from core.history import DEFAULT_HISTORY_POINTS, MAX_HISTORY_POINTS, get_history, record_prices
+from core.suggest import DEFAULT_SUGGESTIONS, MAX_SUGGESTIONS, suggest_index
+from core.alerts import ALERT_ITEM_FIELDS, alert_engine
+from core.list_summary import SUMMARY_ITEM_FIELDS, apply_item_removed, apply_price_changes, price_deltas
+from core.etag import ITEMS_VERSION, LISTS_VERSION, bump_version, get_version, is_not_modified, make_etag, not_modified_response
 
 router = APIRouter()
 
 
+def requested_fields(fields: Optional[str] = Query(
+        None, description="Comma separated item fields to return, e.g. item_name,median_price,volume")):
+    """Parses the fields= parameter into a sorted tuple of Item field names, _id is always included"""
+    if not fields:
+        return None
+    names = {"id" if name == "_id" else name for name in (f.strip() for f in fields.split(",")) if name}
+    if unknown := names - Item.model_fields.keys():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Unknown item fields: {', '.join(sorted(unknown))}")
+    return tuple(sorted(names | {"id"}))
+
+def fields_projection(fields, page=None, rank=None):
+    """Mongo projection for the requested fields, keeping the sort field so the page cursor can be built"""
+    if fields is None:
+        return None
+    projection = {"_id" if name == "id" else name: 1 for name in fields}
+    if page is not None:
+        projection[page.sort] = 1
+    if rank is not None:
+        projection["rank_stats"] = 1
+    return projection
+
+def requested_rank(rank: Optional[int] = Query(
+        None, ge=0, description="Report median_price and volume of this mod rank, e.g. 10 for maxed mods")):
+    return rank
+
+RANKED_FIELDS = ("median_price", "volume")
+
+def rank_sort_key(page, rank):
+    """
+    With a rank, listings sorted on price or volume sort on the value apply_rank
+    reports: that rank's stats for ranked items (0 when the rank never traded),
+    the top-level field for items without ranks
+    """
+    if rank is None or page.sort not in RANKED_FIELDS:
+        return None
+    has_ranks = {"$gt": [{"$size": {"$objectToArray": {"$ifNull": ["$rank_stats", {}]}}}, 0]}
+    ranked = {"$ifNull": [f"$rank_stats.{rank}.{page.sort}", 0]}
+    return f"rank_stats.{rank}.{page.sort}", {"$cond": [has_ranks, ranked, {"$ifNull": [f"${page.sort}", 0]}]}
+
+def apply_rank(item, rank):
+    """Reports one mod rank's stats as the item's median_price and volume, items without ranks are left as is"""
+    if rank is None or not item.get("rank_stats"):
+        return item
+    stats = item["rank_stats"].get(str(rank)) or {"median_price": 0, "volume": 0}
+    return {**item, **stats, "rank": rank}
+
+# Reads are cached in item_cache, tagged so writes can drop exactly what they affect:
+# item:<_id> and url:<url_name> for single items, type:<item_type> for a category
+# listing and type:* for listings across every category.
+ALL_TYPES_TAG = "type:*"
+LISTING_TAGS = (ALL_TYPES_TAG, "type:MOD", "type:COMPONENT", "type:ARCANE")
+
+def item_tags(item):
+    return {f"item:{item['_id']}", f"url:{item.get('url_name')}"}
+
+def invalidate_item(request, item, type_changed=False):
+    """Drops the cached reads of one item, its category listing and the cross-category listings"""
+    listings = LISTING_TAGS if type_changed else (ALL_TYPES_TAG, f"type:{item.get('item_type')}")
+    item_cache.invalidate(*item_tags(item), *listings)
+    bump_version(request.app.database, ITEMS_VERSION)
+
+def compile_item_query(body):
+    """
+    Turns an ItemQuery into one Mongo filter. item_type is an equality match so it leads
+    the item_type_* compound indexes, the ranges then narrow on the sort field's index.
+    """
+    query = {}
+    if body.item_type:
+        query["item_type"] = body.item_type
+    if body.rarity:
+        query["rarity"] = {"$in": body.rarity}
+    tags = {}
+    if body.tags_all:
+        tags["$all"] = body.tags_all
+    if body.tags_any:
+        tags["$in"] = body.tags_any
+    if tags:
+        query["tags"] = tags
+    # with a rank the ranges apply to that rank's stats
+    prefix = "" if body.rank is None else f"rank_stats.{body.rank}."
+    for field, low, high in ((prefix + "median_price", body.min_price, body.max_price),
+                             (prefix + "volume", body.min_volume, body.max_volume)):
+        bounds = {op: value for op, value in (("$gte", low), ("$lte", high)) if value is not None}
+        if bounds:
+            query[field] = bounds
+    if body.max_age_hours:
+        # truncated to the minute so repeated queries share a cache entry
+        cutoff = datetime.utcnow().replace(second=0, microsecond=0) - timedelta(hours=body.max_age_hours)
+        query["last_updated"] = {"$gte": cutoff}
+    return query
+
+@lru_cache(maxsize=128)
+def _adapter(model):
+    return TypeAdapter(model)
+
+def encode_items(items, fields=None):
+    """Validates and serializes items to JSON bytes once, so cached reads skip both steps"""
+    adapter = _adapter(List[Item if fields is None else item_fields_model(fields)])
+    return adapter.dump_json(adapter.validate_python(items), by_alias=True)
+
+def fields_response(items, fields):
+    """Returns items as is, or serialized with the slimmed model when only some fields were requested"""
+    if fields is None:
+        return items
+    return Response(content=encode_items(items, fields), media_type="application/json")
+
+def list_page(request, query, page, fields, tag=ALL_TYPES_TAG, rank=None):
+    # the ETag changes with every write to the items collection, so a polling client gets a 304 until then.
+    # The version is part of the cache key too, a body is only ever served under the ETag it was read for
+    version = get_version(request.app.database, ITEMS_VERSION)
+    key = ("page", version, json_util.dumps(query, sort_keys=True), page.limit, page.sort, page.order, page.next, fields, rank)
+    etag = make_etag(key)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+
+    def load():
+        page_response = Response()
+        items = paginate(request.app.database["items"], query, page, page_response,
+                         fields_projection(fields, page, rank), rank_sort_key(page, rank))
+        return encode_items([apply_rank(item, rank) for item in items], fields), page_response.headers.get(NEXT_CURSOR_HEADER)
+
+    # every listing also carries type:*, which all item writes drop, so a category
+    # outside LISTING_TAGS (e.g. a /query on OTHER) can't outlive a bulk write
+    body, next_cursor = item_cache.get_or_load(key, load, {tag, ALL_TYPES_TAG})
+    headers = {"ETag": etag}
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 
 @router.post("/", response_description="Create a new item", status_code=status.HTTP_201_CREATED, response_model=Item)
 def create_item(request: Request, item: Item = Body(...)):
-    item = jsonable_encoder(item)
-    new_item = request.app.database["items"].insert_one(item)
+    # dates stay dates, like on the bulk and update paths, so last_updated ranges and pages see every item
+    item = item.dict(by_alias=True)
+    item["_id"] = str(item["_id"])
+    try:
+        new_item = request.app.database["items"].insert_one(item)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Item {item['url_name']} already exists")
     created_item = request.app.database["items"].find_one(
         {"_id": new_item.inserted_id}
     )
+    invalidate_item(request, created_item)
+    suggest_index.upsert(created_item)
 
     return created_item
 
+@router.post("/bulk", response_description="Upsert many items in one write, keyed on url_name", response_model=BulkUpsertResponse)
+def bulk_upsert_items(request: Request, items: List[dict] = Body(...)):
+    """
+    Insert new items and update existing ones (matched by url_name) with a single
+    unordered bulk_write. Items are validated one by one so a bad entry only fails
+    itself, and when a url_name is sent more than once the last copy wins.
+    """
+    results = [None] * len(items)
+    valid = {}
+    latest = {}
+    for index, raw in enumerate(items):
+        try:
+            valid[index] = Item(**raw)
+        except (ValidationError, TypeError) as e:
+            url_name = raw.get("url_name") if isinstance(raw, dict) else None
+            results[index] = BulkItemResult(url_name=url_name, status="invalid", error=str(e))
+            continue
+        url_name = valid[index].url_name
+        if url_name in latest:
+            results[latest[url_name]] = BulkItemResult(url_name=url_name, status="duplicate")
+        latest[url_name] = index
+
+    op_indexes = sorted(latest.values())
+    operations = []
+    for index in op_indexes:
+        # fields the caller didn't send (e.g. order_book on a stats only refresh) keep their stored value
+        doc = valid[index].dict(exclude_none=True)
+        item_id = str(doc.pop("id"))
+        operations.append(UpdateOne(
+            {"url_name": doc["url_name"]},
+            {"$set": doc, "$setOnInsert": {"_id": item_id}},
+            upsert=True))
+
+    upserted, errors = {}, {}
+    if operations:
+        # stats before the write, to move the summaries of the lists holding these items
+        before = {doc["_id"]: doc for doc in request.app.database["items"].find(
+            {"url_name": {"$in": [valid[index].url_name for index in op_indexes]}}, SUMMARY_ITEM_FIELDS)}
+        try:
+            result = request.app.database["items"].bulk_write(operations, ordered=False)
+            upserted = result.upserted_ids
+        except BulkWriteError as e:
+            upserted = {u["index"]: u["_id"] for u in e.details.get("upserted", [])}
+            errors = {err["index"]: err.get("errmsg") for err in e.details.get("writeErrors", [])}
+        # a batch touches most categories, so every listing is dropped along with the items themselves
+        item_cache.invalidate(*LISTING_TAGS, *(f"url:{valid[index].url_name}" for index in op_indexes))
+        bump_version(request.app.database, ITEMS_VERSION)
+        suggest_index.refresh(request.app.database["items"], (valid[index].url_name for index in op_indexes))
+        # every written item's stats become a point in its price history
+        written = [valid[index].url_name for op_index, index in enumerate(op_indexes) if op_index not in errors]
+        after = list(request.app.database["items"].find(
+            {"url_name": {"$in": written}}, {**SUMMARY_ITEM_FIELDS, **ALERT_ITEM_FIELDS}))
+        record_prices(request.app.database, after)
+        after = {doc["_id"]: doc for doc in after}
+        if apply_price_changes(request.app.database, price_deltas(before, after)):
+            bump_version(request.app.database, LISTS_VERSION)
+        alert_engine.evaluate(request.app.database, before, after)
+
+    response = BulkUpsertResponse()
+    for op_index, index in enumerate(op_indexes):
+        url_name = valid[index].url_name
+        if op_index in errors:
+            results[index] = BulkItemResult(url_name=url_name, status="failed", error=errors[op_index])
+            response.failed += 1
+        elif op_index in upserted:
+            results[index] = BulkItemResult(url_name=url_name, status="inserted", id=str(upserted[op_index]))
+            response.inserted += 1
+        else:
+            results[index] = BulkItemResult(url_name=url_name, status="updated")
+            response.updated += 1
+    response.failed += sum(1 for r in results if r.status == "invalid")
+    response.results = results
+    return response
+
 # todo see todo in the user_router about getting items by id instead
+# listings are paginated, the cursor for the next page comes back in the X-Next-Cursor header,
+# and fields= limits the response (and the Mongo projection) to the named item fields
 @router.get("/mods", response_description="List all items with item_type MOD", response_model=List[Item])
-def list_mods(request: Request):
-    items = list(request.app.database["items"].find({"item_type": "MOD"}))
-    return items
+def list_mods(request: Request, page: PageParams = Depends(),
+              fields: Optional[tuple] = Depends(requested_fields), rank: Optional[int] = Depends(requested_rank)):
+    return list_page(request, {"item_type": "MOD"}, page, fields, "type:MOD", rank)
 
 @router.get("/primes", response_description="List all prime parts items", response_model=List[Item])
-def list_prime_parts(request: Request):
-    items = list(request.app.database["items"].find({"item_type": "COMPONENT"}))
-    return items
+def list_prime_parts(request: Request, page: PageParams = Depends(),
+                     fields: Optional[tuple] = Depends(requested_fields)):
+    return list_page(request, {"item_type": "COMPONENT"}, page, fields, "type:COMPONENT")
 
 @router.get("/arcanes", response_description="List all arcaneitems", response_model=List[Item])
-def list_arcanes(request: Request):
-    items = list(request.app.database["items"].find({"item_type": "ARCANE"}))
-    return items
+def list_arcanes(request: Request, page: PageParams = Depends(),
+                 fields: Optional[tuple] = Depends(requested_fields), rank: Optional[int] = Depends(requested_rank)):
+    return list_page(request, {"item_type": "ARCANE"}, page, fields, "type:ARCANE", rank)
 
 #todo mods and primes need to be one method, and we pass in the filter somehow
 #  thoughts: we just pass in the filter as an object. e.g. {filter: {"item_type": "COMPONENT"}}
 @router.post("/search-items", response_description="Return all items mathcing the filter clause", response_model=List[Item])
 # def get_items_by_filter(request: Request, body: dict = Body(...)):
-def get_items_by_filter(request: Request, body: Filter): 
+def get_items_by_filter(request: Request, body: Filter, page: PageParams = Depends(),
+                        fields: Optional[tuple] = Depends(requested_fields),
+                        rank: Optional[int] = Depends(requested_rank)):
     data = jsonable_encoder(body)
     property_name = data["property_name"]
     search_term = data["search_term"]
+    if property_name not in Item.model_fields:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown item field: {property_name}")
     filter = {property_name : search_term}
     wildcard = data["wildcard"]
     if wildcard:
-        filter = {property_name: 
-                   {"$regex" : search_term}}
+        # anchored and escaped, so it's a prefix match that can use the field's index
+        # and the caller can't send a pathological pattern. Use /item/suggest for fuzzy search.
+        filter = {property_name:
+                   {"$regex" : "^" + re.escape(search_term)}}
 
     print(f"data filter = {filter}")
-    items = list(request.app.database["items"].find(filter))
+    return list_page(request, filter, page, fields, rank=rank)
 
-    return items
+@router.post("/query", response_description="Items matching every condition of a structured query", response_model=List[Item])
+def query_items(request: Request, body: ItemQuery, page: PageParams = Depends(),
+                fields: Optional[tuple] = Depends(requested_fields)):
+    """Filters, sorts and paginates in Mongo, so clients only receive the page they display"""
+    tag = f"type:{body.item_type}" if body.item_type else ALL_TYPES_TAG
+    return list_page(request, compile_item_query(body), page, fields, tag, body.rank)
 
 #todo I think think is no longer used/ was just used for test
 @router.get("/my-list/{user_id}", response_description="List all items in the users list of items tracked", response_model=List[Item])
@@ -88,20 +330,50 @@ def add_to_user_list(request: Request, body: dict = Body(...)):
 
 
 @router.get("/", response_description="List all items", response_model=List[Item])
-def list_items(request: Request):
-    items = list(request.app.database["items"].find())
-    return items
+def list_items(request: Request, page: PageParams = Depends(),
+               fields: Optional[tuple] = Depends(requested_fields), rank: Optional[int] = Depends(requested_rank)):
+    return list_page(request, {}, page, fields, rank=rank)
+
+@router.get("/export", response_description="Stream the item catalog as newline delimited JSON")
+def export_items(request: Request, item_type: Optional[str] = None, gzip: bool = False):
+    """Streams every item (optionally only one item_type) straight from a Mongo cursor, one JSON document per line"""
+    query = {"item_type": item_type} if item_type else {}
+    cursor = request.app.database["items"].find(query, batch_size=EXPORT_BATCH_SIZE)
+    headers = {"Content-Encoding": "gzip"} if gzip else None
+    return StreamingResponse(ndjson_stream(cursor, gzip=gzip), media_type="application/x-ndjson", headers=headers)
+
+@router.get("/suggest", response_description="Ranked, typo tolerant autocomplete over item names and tags")
+def suggest_items(request: Request, q: str = Query(..., min_length=1, max_length=100),
+                  limit: int = Query(DEFAULT_SUGGESTIONS, ge=1, le=MAX_SUGGESTIONS),
+                  item_type: Optional[str] = None):
+    suggest_index.ensure_built(request.app.database["items"])
+    return suggest_index.search(q, limit, item_type)
+
+@router.get("/cache-stats", response_description="Hit, miss and eviction counters of the item read cache")
+def cache_stats():
+    return item_cache.stats()
 
 @router.get("/{id}", response_description="Get a single item by id", response_model=Item)
-def find_item(id: str, request: Request):
-    if (item := request.app.database["items"].find_one({"_id": id})) is not None:
-        return item
-    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Item with ID {id} not found")
+def find_item(id: str, request: Request, rank: Optional[int] = Depends(requested_rank)):
+    key = ("item", get_version(request.app.database, ITEMS_VERSION), id, rank)
+    etag = make_etag(*key)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+
+    def load():
+        if (item := request.app.database["items"].find_one({"_id": id})) is not None:
+            return item, _adapter(Item).dump_json(Item.model_validate(apply_rank(item, rank)), by_alias=True)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Item with ID {id} not found")
+
+    _, body = item_cache.get_or_load(key, load, lambda loaded: item_tags(loaded[0]))
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 @router.post("/get-items", response_description="Get multiple items by IDs", response_model=List[Item])
-def find_items(request: Request, ids: List[str] = Body(...)):
+def find_items(request: Request, ids: List[str] = Body(...), fields: Optional[tuple] = Depends(requested_fields),
+               rank: Optional[int] = Depends(requested_rank)):
     # Query MongoDB for items matching any of the provided IDs
-    items = list(request.app.database["items"].find({"_id": {"$in": ids}}))
+    items = [apply_rank(item, rank) for item in
+             request.app.database["items"].find({"_id": {"$in": ids}}, fields_projection(fields, rank=rank))]
     
     if not items:
         raise HTTPException(
@@ -110,11 +382,26 @@ def find_items(request: Request, ids: List[str] = Body(...)):
         )
     
     print(f"found itesm: {items}")
-    return items
+    return fields_response(items, fields)
+
+@router.get("/{id}/history", response_description="Price history of an item at the requested resolution", response_model=List[PricePoint])
+def item_history(id: str, request: Request, resolution: Resolution = "day",
+                 since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 limit: int = Query(DEFAULT_HISTORY_POINTS, ge=1, le=MAX_HISTORY_POINTS)):
+    """
+    raw returns every stats refresh, hour/day/week read the rollup buckets maintained on
+    each refresh, so long ranges stay at a few hundred points. At most `limit` of the most
+    recent points are returned, oldest first.
+    """
+    if request.app.database["items"].find_one({"_id": id}, {"_id": 1}) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Item with ID {id} not found")
+    return get_history(request.app.database, id, resolution, since, until, limit)
 
 @router.put("/{id}", response_description="Update a item", response_model=Item)
 def update_item(id: str, request: Request, item: ItemUpdate = Body(...)):
     item = {k: v for k, v in item.dict().items() if v is not None}
+    stats_changed = "median_price" in item or "volume" in item
+    previous = request.app.database["items"].find_one({"_id": id}, SUMMARY_ITEM_FIELDS) if stats_changed else None
     if len(item) >= 1:
         update_result = request.app.database["items"].update_one(
             {"_id": id}, {"$set": item}
@@ -126,6 +413,16 @@ def update_item(id: str, request: Request, item: ItemUpdate = Body(...)):
     if (
         existing_item := request.app.database["items"].find_one({"_id": id})
     ) is not None:
+        if len(item) >= 1:
+            invalidate_item(request, existing_item, type_changed="item_type" in item)
+            suggest_index.upsert(existing_item)
+            if stats_changed:
+                record_prices(request.app.database, [existing_item])
+                if previous and apply_price_changes(request.app.database,
+                                                    price_deltas({id: previous}, {id: existing_item})):
+                    bump_version(request.app.database, LISTS_VERSION)
+                if previous:
+                    alert_engine.evaluate(request.app.database, {id: previous}, {id: existing_item})
         return existing_item
 
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Item with ID {id} not found")
@@ -134,9 +431,14 @@ def update_item(id: str, request: Request, item: ItemUpdate = Body(...)):
 
 @router.delete("/{id}", response_description="Delete a item")
 def delete_item(id: str, request: Request, response: Response):
-    delete_result = request.app.database["items"].delete_one({"_id": id})
-
-    if delete_result.deleted_count == 1:
+    deleted_item = request.app.database["items"].find_one_and_delete(
+        {"_id": id}, projection={"url_name": 1, "item_type": 1, **SUMMARY_ITEM_FIELDS})
+
+    if deleted_item is not None:
+        invalidate_item(request, deleted_item)
+        suggest_index.remove(deleted_item["_id"])
+        if apply_item_removed(request.app.database, deleted_item):
+            bump_version(request.app.database, LISTS_VERSION)
         response.status_code = status.HTTP_204_NO_CONTENT
         return response
 
@@ -1,15 +1,46 @@
 from datetime import datetime
-from typing import List
-from fastapi import APIRouter, Body, Depends, HTTPException, Request, status
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response, status
 from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 # from dependencies import DBCollections
 from models.listModel import ListCreate, ListDB, ListUpdate, ListResponse, PyObjectId
+from models.itemModels import Item, item_fields_model
 from core.auth import auth_service
+from core.db import run_db
+from core.alerts import alert_engine
+from core.list_summary import apply_membership, empty_summary
+from core.lookup import items_lookup_pipeline
+from core.etag import ITEMS_VERSION, LISTS_VERSION, bump_version, get_version, is_not_modified, not_modified_response, request_etag
+from pymongo import ReturnDocument
 from pymongo.collection import Collection
 from main import get_lists_collection
+from routers.item_router import _adapter, fields_projection, requested_fields
 
 router = APIRouter()
 
+Expand = Optional[Literal["items"]]
+EXPAND_DESCRIPTION = "items joins each list's items (in list order) into item_details, fields= slims them down"
+
+
+async def list_versions(lists_collection, expand):
+    """Data versions behind a list read, expanded lists also change with every item write"""
+    versions = [await run_db(get_version, lists_collection.database, LISTS_VERSION)]
+    if expand:
+        versions.append(await run_db(get_version, lists_collection.database, ITEMS_VERSION))
+    return versions
+
+async def expanded_lists(lists_collection, match, fields, etag):
+    """Lists matching match with their items joined in, one aggregation and one round trip"""
+    pipeline = items_lookup_pipeline(match, "items", projection=fields_projection(fields))
+    # aggregate() sends the command and waits for the first batch, so it has to run on the db executor too
+    lists = await run_db(lambda: list(lists_collection.aggregate(pipeline)))
+    adapter = _adapter(List[Item if fields is None else item_fields_model(fields)])
+    body = [{**ListResponse(**lst).model_dump(mode="json", by_alias=True),
+             "item_details": adapter.dump_python(adapter.validate_python(lst["item_details"]), mode="json", by_alias=True)}
+            for lst in lists]
+    return body, {"ETag": etag}
+
 @router.post("/", response_model=ListResponse, status_code=status.HTTP_201_CREATED)
 async def create_list(
     list_data: ListCreate,
@@ -30,21 +61,32 @@ async def create_list(
         # item = jsonable_encoder(item)
     jsonable = jsonable_encoder(db_list)
     print(db_list)
-    result = lists_collection.insert_one(dict(db_list))
+    result = await run_db(lists_collection.insert_one, {**dict(db_list), "summary": empty_summary()})
+    await run_db(bump_version, lists_collection.database, LISTS_VERSION)
     # result = lists_collection.insert_one(jsonable)
-    created_list = lists_collection.find_one({"_id": result.inserted_id})
+    created_list = await run_db(lists_collection.find_one, {"_id": result.inserted_id})
     
     return ListResponse(**created_list)
 
 @router.get("/", response_model=List[ListResponse])
-async def get_user_lists(current_user: PyObjectId = Depends(auth_service.get_current_user_id),
-                         lists_collection : Collection = Depends(get_lists_collection)):
+async def get_user_lists(request: Request, response: Response,
+                         current_user: PyObjectId = Depends(auth_service.get_current_user_id),
+                         lists_collection : Collection = Depends(get_lists_collection),
+                         expand: Expand = Query(None, description=EXPAND_DESCRIPTION),
+                         fields: Optional[tuple] = Depends(requested_fields)):
     """Get all lists for the current user"""
+    etag = request_etag(request, *await list_versions(lists_collection, expand), str(current_user))
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    if expand:
+        body, headers = await expanded_lists(lists_collection, {"owner_id": current_user}, fields, etag)
+        return JSONResponse(body, headers=headers)
+    response.headers["ETag"] = etag
     print(f"Gettting user lists for current user with id {current_user}")
     # test = [t for t in lists_collection.find()]
     # print(type(test[-1]["owner_id"]))
     # print(type(current_user))
-    user_lists = lists_collection.find({"owner_id": current_user})
+    user_lists = await run_db(list, lists_collection.find({"owner_id": current_user}))
     print(f"user_lists: {user_lists}")
     # print([lst for lst in user_lists])
     # print([ListResponse(**lst) for lst in user_lists])
@@ -54,10 +96,23 @@ async def get_user_lists(current_user: PyObjectId = Depends(auth_service.get_cur
 @router.get("/{list_id}", response_model=ListResponse)
 async def get_list(
     list_id: PyObjectId,
+    request: Request,
+    response: Response,
     current_user: PyObjectId = Depends(auth_service.get_current_user_id),
-    lists_collection : Collection = Depends(get_lists_collection)):
+    lists_collection : Collection = Depends(get_lists_collection),
+    expand: Expand = Query(None, description=EXPAND_DESCRIPTION),
+    fields: Optional[tuple] = Depends(requested_fields)):
     """Get a specific list by ID"""
-    if (lst := lists_collection.find_one({"_id": list_id, "owner_id": current_user})) is None:
+    etag = request_etag(request, *await list_versions(lists_collection, expand), str(current_user))
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    if expand:
+        body, headers = await expanded_lists(lists_collection, {"_id": list_id, "owner_id": current_user}, fields, etag)
+        if not body:
+            raise HTTPException(status_code=404, detail="List not found")
+        return JSONResponse(body[0], headers=headers)
+    response.headers["ETag"] = etag
+    if (lst := await run_db(lists_collection.find_one, {"_id": list_id, "owner_id": current_user})) is None:
         raise HTTPException(status_code=404, detail="List not found")
     return ListResponse(**lst)
 
@@ -69,9 +124,6 @@ async def update_list(
     current_user: PyObjectId = Depends(auth_service.get_current_user_id),
     lists_collection : Collection = Depends(get_lists_collection)):
     """Update list name or modify items"""
-    existing = lists_collection.find_one({"_id": list_id, "owner_id": current_user})
-    if not existing:
-        raise HTTPException(status_code=404, detail="List not found")
     updates = {
         "$set": {"updated_at": datetime.utcnow()}
     }
@@ -94,14 +146,26 @@ async def update_list(
             "items": update_data.remove_items if isinstance(update_data.remove_items, list) else [update_data.remove_items]
         }
     
-    # Perform the update
-    result = lists_collection.update_one(
+    # Perform the update, keeping the pre-image so concurrent edits can't skew the diff below
+    existing = await run_db(
+        lists_collection.find_one_and_update,
         {"_id": list_id, "owner_id": current_user},
-        updates
+        updates,
+        return_document=ReturnDocument.BEFORE
     )
+    if not existing:
+        raise HTTPException(status_code=404, detail="List not found")
+    # only ids that really joined or left the list move its summary
+    current = set(existing.get("items") or ())
+    added = {item_id for item_id in updates.get("$addToSet", {}).get("items", {}).get("$each", ()) if item_id not in current}
+    removed = {item_id for item_id in updates.get("$pullAll", {}).get("items", ()) if item_id in current}
+    await run_db(apply_membership, lists_collection.database, list_id, added, removed)
+    if added or removed:
+        await run_db(alert_engine.refresh_user, lists_collection.database, {"_id": current_user})
+    await run_db(bump_version, lists_collection.database, LISTS_VERSION)
 
      
-    updated_list = lists_collection.find_one({"_id": list_id})
+    updated_list = await run_db(lists_collection.find_one, {"_id": list_id})
     return ListResponse(**updated_list)
 
 @router.delete("/{list_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -110,7 +174,9 @@ async def delete_list(
     current_user: PyObjectId = Depends(auth_service.get_current_user_id),
     lists_collection : Collection = Depends(get_lists_collection)):
     """Delete a list"""
-    result = lists_collection.delete_one({"_id": list_id, "owner_id": current_user})
+    result = await run_db(lists_collection.delete_one, {"_id": list_id, "owner_id": current_user})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="List not found")
+    await run_db(bump_version, lists_collection.database, LISTS_VERSION)
+    await run_db(alert_engine.refresh_user, lists_collection.database, {"_id": current_user})
     return None
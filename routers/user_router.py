@@ -1,5 +1,4 @@
 from datetime import timedelta
-from dotenv import dotenv_values
 from fastapi import APIRouter, Body, Request, Response, HTTPException, status
 from fastapi.encoders import jsonable_encoder
 from fastapi import FastAPI, HTTPException, Depends
@@ -8,29 +7,22 @@ from typing import List
 from models.itemModels import Item
 from models.userModel import *
 from jose import jwt, JWTError
-import bcrypt
+from pymongo.errors import DuplicateKeyError
 
+from core.config import config
+from core.alerts import alert_engine
+from core.db import run_db
+from core.lookup import items_lookup_pipeline
+from core.passwords import hash_password_async, verify_password_async
 
-router = APIRouter()
-
-
-def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
-    hashed_password = bcrypt.hashpw(password.encode("utf-8"), salt)
-    return hashed_password.decode("utf-8")
-
-# Verify password function
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
 
+router = APIRouter()
 
 
 # OAuth2 for token-based authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 
-config = dotenv_values(".env")
-
 SECRET_KEY = config.get("TOKEN_KEY")
 ALGORITHM = config.get("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(config.get("ACCESS_TOKEN_EXPIRE_MINUTES"))
@@ -60,7 +52,7 @@ async def protected_route(request: Request,
 
     print("HIT PROTEC")
     users_collection = request.app.database["users"]
-    user = users_collection.find_one({"email": current_user})
+    user = await run_db(users_collection.find_one, {"email": current_user})
     if user is None:
         raise credentials_exception
     # return user
@@ -80,13 +72,13 @@ async def register(request: Request, user: UserCreate):
     print("HIT REGISTER")
     # Check if the username or email already exists
     users_collection = request.app.database["users"]
-    if users_collection.find_one({"username": user.username}):
+    if await run_db(users_collection.find_one, {"username": user.username}):
         raise HTTPException(status_code=400, detail="Username already exists")
-    if users_collection.find_one({"email": user.email}):
+    if await run_db(users_collection.find_one, {"email": user.email}):
         raise HTTPException(status_code=400, detail="Email already exists")
 
     # Hash the password
-    hashed_password = hash_password(user.password)
+    hashed_password = await hash_password_async(user.password)
 
     # Create the user in the database
     user_data = UserInDB(
@@ -96,7 +88,11 @@ async def register(request: Request, user: UserCreate):
         updated_at=datetime.utcnow(),
     ).dict()
 
-    users_collection.insert_one(user_data)
+    try:
+        await run_db(users_collection.insert_one, user_data)
+    except DuplicateKeyError:
+        # lost a race with a concurrent registration, the unique indexes catch it
+        raise HTTPException(status_code=400, detail="Username or email already exists")
     return user_data
 
 @router.post("/login", response_model=UserLoginResponse)
@@ -105,21 +101,37 @@ async def login(request: Request, user: UserLogin):
     print("HIT LOGIN")
     users_collection = request.app.database["users"]
     # db_user = users_collection.find_one({"username": user.username})
-    db_user = users_collection.find_one({"email": user.email})
-    if not db_user or not verify_password(user.password, db_user["password_hash"]):
+    db_user = await run_db(users_collection.find_one, {"email": user.email})
+    if not db_user or not await verify_password_async(user.password, db_user["password_hash"]):
         raise HTTPException(status_code=400, detail="Invalid username or password")
 
     # Update last login time
-    users_collection.update_one(
+    await run_db(
+        users_collection.update_one,
         # {"username": user.username},
         {"email": user.email},
         {"$set": {"last_login": datetime.utcnow()}},
     )
     # Create JWT token
-    access_token = create_access_token(data={"sub": user.email})
+    access_token = create_access_token(data={"sub": user.email, "uid": str(db_user["_id"])})
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+@router.post("/notifications", response_model=UserPublic)
+async def update_notifications(request: Request, notifications: Notifications,
+                               current_user: dict = Depends(get_current_user_email)):
+    """Turn price drop alerts on or off, price_drop_threshold is the drop in percent that triggers one"""
+    users_collection = request.app.database["users"]
+    result = await run_db(
+        users_collection.update_one,
+        {"email": current_user},
+        {"$set": {"notifications": notifications.dict(), "updated_at": datetime.utcnow()}},
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="User not found")
+    await run_db(alert_engine.refresh_user, request.app.database, {"email": current_user})
+    return await run_db(users_collection.find_one, {"email": current_user})
+
 # todo, these should depend on the token  and pull the username that way
 # todo - This probably isn't a proper POST request, we're updating part of 
 # the watchlist. Actually, this logic maybe needs to completely move to the new
@@ -137,11 +149,13 @@ async def delete_from_user_list(request: Request, body: dict = Body(...),
     itemIds = data.get("itemIds")
     # print(itemIds)
 
-    users_collection.update_one(
+    await run_db(
+        users_collection.update_one,
         {'email': user_email},
         {"$pull": {"watchlist": {"$in" : itemIds} }}
     )
-    updated_user = users_collection.find_one({"email": user_email})
+    await run_db(alert_engine.refresh_user, request.app.database, {"email": user_email})
+    updated_user = await run_db(users_collection.find_one, {"email": user_email})
     return updated_user
 
 # todo - made redundant by lists router
@@ -159,14 +173,16 @@ async def add_to_user_list(request: Request, body: dict = Body(...),
     user_email = current_user
     userId = data.get("userId")
     itemIds = data.get("itemIds")
-    users_collection.update_one(
+    await run_db(
+        users_collection.update_one,
         {'email': user_email},
         # {"username": userId},
         {"$addToSet": {"watchlist":  {
                        "$each": itemIds}}},  # Add item to watchlist if not already present
     )
+    await run_db(alert_engine.refresh_user, request.app.database, {"email": user_email})
     # updated_user = users_collection.find_one({"username": userId})
-    updated_user = users_collection.find_one({"email": user_email})
+    updated_user = await run_db(users_collection.find_one, {"email": user_email})
     return updated_user
 
 # todo, maybe it makes sense that this should just return the list of ids, and then we can have a separate call to return a list of items
@@ -178,13 +194,11 @@ async def get_watchlist(request: Request, current_user: dict = Depends(get_curre
     users_collection = request.app.database["users"]
     # print(username)
     # username = 
-    user = users_collection.find_one({"email": current_user})
-    if not user:
+    # the user and their items in one round trip, in watchlist order
+    pipeline = items_lookup_pipeline({"email": current_user}, "watchlist")
+    users = await run_db(lambda: list(users_collection.aggregate(pipeline)))
+    if not users:
         raise HTTPException(status_code=404, detail="User not found")
-    print(user)
-    item_ids = user["watchlist"]
-    items = list(request.app.database["items"].find({"_id": { "$in" : item_ids } } ) )
-    print(items)
-    return items
+    return users[0]["item_details"]
 
    
\ No newline at end of file
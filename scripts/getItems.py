@@ -1,17 +1,36 @@
 import argparse
+import os
+import sys
 from pymongo import MongoClient
 from dotenv import dotenv_values
 import json
 import requests
-import statistics
 from datetime import datetime, timedelta, timezone
 
+# make the backend's core package importable when run from the scripts directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from core.market_client import DEFAULT_RATE, MarketClient
+from ingest import DEFAULT_BATCH_SIZE, DEFAULT_CONCURRENCY, run_pipeline
+from core.indexes import reconcile_collection
+from core.migrations import migrate_string_dates
+from models.itemModels import ITEM_INDEXES
+from scheduler import DEFAULT_BUDGET, DEFAULT_DAEMON_INTERVAL, refresh_due_items, run_daemon
+
 
 
 
 
 config = dotenv_values("../.env")
 TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.00Z"
+_market = None
+
+
+def get_market():
+    """The shared client, created on first use so importing this module doesn't open a connection pool"""
+    global _market
+    if _market is None:
+        _market = MarketClient()
+    return _market
 
 
 def write_dicts_to_log(dict_list, log_file="output.log", mode="a", format="json"):
@@ -54,13 +73,6 @@ def validate_item(item):
     return item
 
 
-def add_item(data):
-    """Adds the item to the database using an API endpoint with an updated last updated time"""
-    data = validate_item(data)
-    data["last_updated"] = datetime.now().strftime(TIME_FORMAT)
-    resp = requests.post(f"{config['BACKEND_API']}:{config['BACKEND_API_PORT']}/item", json = data)
-    return resp
-
 def startup_db_client():
     mongodb_client = MongoClient(config["ATLAS_URI"])
     database = mongodb_client[config["DB_NAME"]]
@@ -71,173 +83,167 @@ def get_items_collection():
     return DB["items"]
 
 
-def get_all_items():
-    # returns the item url_names and their id in the database
+def get_db_url_names():
+    """Returns the set of url_names in the database"""
     items = get_items_collection()
-    # all_items = list(items.find({}, {"url_name" : 1}))
-    all_items = list(items.find())
-    return all_items
+    # no index hint: it fails the query outright where the url_name index hasn't been built
+    cursor = items.find({}, {"url_name": 1, "_id": 0})
+    return {item["url_name"] for item in cursor}
 
 def get_items_from_web(limit_returned=None):
     # gets the list of items from warframe market
     print("Getting items list from web")
-    items = requests.get("https://api.warframe.market/v1/items").json();
-    return items["payload"]["items"][0:limit_returned]
-
-
-def get_item_info_from_web(item = None, item_url = None):
-    """ Get the item info from the web using the passed in item_url, or by getting the item_url from a passed in item"""
-    if not item_url:
-        if not item:
-            raise Exception("no item or item_url provided")
-        item_url = item["url_name"]
-    raw_item_info = requests.get(f"https://api.warframe.market/v1/items/{item_url}").json()["payload"]["item"]["items_in_set"][0]
-    item_info = {
-        "thumb": raw_item_info["thumb"],
-        "item_name": raw_item_info["en"]["item_name"],
-        "wiki_link": raw_item_info["en"]["wiki_link"],
-        "market_link": f"https://warframe.market/items/{item_url}",
-        "rarity": raw_item_info.get("rarity", "N/A"),
-        "tags": raw_item_info["tags"],
-        "item_type": get_item_type(raw_item_info["tags"])
-        }
-    item.update(item_info)
-    return item
-
-
-def get_item_type(tags):
-    if "mod" in tags:
-        return "MOD"
-    if "component" in tags:
-        return "COMPONENT"
-    return "OTHER"
-
-
-
-def get_item_stat_from_web(item, mod_rank = 0):
-    raw_item_order_info = requests.get(f"https://api.warframe.market/v1/items/{item['url_name']}/statistics").json()["payload"]["statistics_closed"]["48hours"]
-    median = 0
-    volume = 0
-    if len(raw_item_order_info) > 0:
-        if "mod_rank" in raw_item_order_info[0]:
-            filtered_order_info = [order for order in raw_item_order_info if order["mod_rank"] == mod_rank]
-        else:
-            filtered_order_info = raw_item_order_info
-        if filtered_order_info:
-            median = statistics.mean([order["median"] for order in filtered_order_info])
-            volume = statistics.mean([order["volume"] for order in filtered_order_info])
-    item_order_info = {
-            "median_price" : round(median, 2),
-            "volume" : round(volume, 2),
-            "rank" : mod_rank
-    }
-    item.update(item_order_info)
-    return item
+    items = get_market().get_items()
+    return items[0:limit_returned]
 
 
-def add_new_items():
-    # get list of items missing from items in db
-    missing_items = getMissingItems()
-    print(f"Found {len(missing_items)} missing items")
-    log = []
-    for item in missing_items:
-        print("Updating missing items")
-        log.append(createNewItem(item))
-    # log of items created
+def add_new_items(concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, batch_size=DEFAULT_BATCH_SIZE, orders=False):
+    diff = diff_catalog()
     timestamp = datetime.now().strftime("%Y-%m-%d-%H:%M:%S")
+    print(f"Found {len(diff['missing'])} missing, {len(diff['renamed'])} renamed and {len(diff['removed'])} removed items")
+    if diff["renamed"]:
+        write_dicts_to_log([rename_item(db_item, web_item) for db_item, web_item in diff["renamed"]],
+                           log_file=f"renamed_items_{timestamp}.log")
+    if diff["removed"]:
+        # items can disappear from the listing temporarily, so they are only reported
+        write_dicts_to_log([{"url_name": url_name} for url_name in sorted(diff["removed"])],
+                           log_file=f"removed_items_{timestamp}.log")
+    # fetch info and stats for the missing items concurrently, upserting them in batches as they are ready
+    endpoints = ("info", "stats", "orders") if orders else ("info", "stats")
+    log = run_pipeline(diff["missing"], endpoints, persist_items,
+                       concurrency=concurrency, rate=rate, batch_size=batch_size)
+    # log of items created
     write_dicts_to_log(log, log_file=f"new_items_{timestamp}.log")
 
 
-def getMissingItems():
-    missing_items = []
-    # get list of current items in db
-    current_items = get_all_items()
-    db_url_names = [item["url_name"] for item in current_items]
-    # get list of all items from web
-    web_items = get_items_from_web()
-    missing_items = [web_item for web_item in web_items if web_item["url_name"] not in db_url_names]
-    return missing_items
-
-def createNewItem(item):
-    #get item info
-    item_info = get_item_info_from_web(item)
-    #get item stats
-    item_stats = get_item_stat_from_web(item_info)
-    #add item to db using api
-    resp = add_item(item_stats)
-    # return request status -- todo make a report of items failed to add
-    if resp.ok:
-        return {"details": resp.json(),  "status": resp.status_code}
-    else:
-        return {"status": resp.status_code, "details":
-                {"reason": resp.reason,
-                 "item_name" : item_stats["item_name"]}}
+def diff_catalog():
+    """
+    Compares the warframe.market item list with the database.
 
+    Returns the web items missing from the database, the url_names no longer
+    listed upstream, and (db item, web item) pairs for url_names that were renamed,
+    matched on item_name between the missing and removed items.
+    """
+    db_url_names = get_db_url_names()
+    web_items = {web_item["url_name"]: web_item for web_item in get_items_from_web()}
+    missing = web_items.keys() - db_url_names
+    removed = db_url_names - web_items.keys()
+
+    renamed = []
+    if missing and removed:
+        missing_by_name = {web_items[url_name].get("item_name"): web_items[url_name] for url_name in missing}
+        removed_items = get_items_collection().find({"url_name": {"$in": list(removed)}},
+                                                    {"url_name": 1, "item_name": 1})
+        for db_item in removed_items:
+            if (web_item := missing_by_name.get(db_item.get("item_name"))) is not None:
+                renamed.append((db_item, web_item))
+                missing.discard(web_item["url_name"])
+                removed.discard(db_item["url_name"])
+
+    return {"missing": [web_items[url_name] for url_name in missing],
+            "removed": removed,
+            "renamed": renamed}
+
+
+def rename_item(db_item, web_item):
+    """Points an existing item at its new url_name instead of creating a duplicate"""
+    url_name = web_item["url_name"]
+    resp = requests.put(f"{config['BACKEND_API']}:{config['BACKEND_API_PORT']}/item/{db_item['_id']}",
+                        json={"url_name": url_name, "market_link": f"https://warframe.market/items/{url_name}"})
+    return {"status": resp.status_code, "details":
+            {"from": db_item["url_name"], "to": url_name, "item_name": db_item.get("item_name")}}
+
+def response_log(resp, item):
+    if resp.is_success:
+        return {"details": resp.json(),  "status": resp.status_code}
+    return {"status": resp.status_code, "details":
+            {"reason": resp.reason_phrase,
+             "item_name" : item.get("item_name", item)}}
 
-def is_updated_within_one_day(item):
-    last_updated = item.get("last_updated")
-    now = datetime.now()
-    # Calculate difference
-    time_diff = now - last_updated
-    return time_diff < timedelta(hours=24)
 
-                
-def get_expired(items):
-    expired = [item for item in items if not is_updated_within_one_day(item)]
-    return expired
+async def persist_items(client, items):
+    """Upserts a batch of items through the bulk endpoint, returns a log entry per item"""
+    now = datetime.now().strftime(TIME_FORMAT)
+    data = [validate_item(item) for item in items]
+    for item in data:
+        item["last_updated"] = now
+    resp = await client.post(f"{config['BACKEND_API']}:{config['BACKEND_API_PORT']}/item/bulk", json=data)
+    if not resp.is_success:
+        return [response_log(resp, item) for item in data]
+    return [{"status": result["status"], "details": result} for result in resp.json()["results"]]
 
 
-def update_item_stats(item):
-    item = get_item_stat_from_web(item)
-    resp = update_item(item)
-    if resp.ok:
-        return {"details": resp.json(),  "status": resp.status_code}
-    else:
-        return {"status": resp.status_code, "details":
-                {"reason": resp.reason,
-                 "item_name" : item.get("item_name", item)}}
-
-
-def update_item(item):
-    resp = requests.put( f"{config['BACKEND_API']}:{config['BACKEND_API_PORT']}/item/{item["_id"]}", json=item)
-    return resp    
-
-
-def update_items():
-    # should we populate the updated stat items to a queue and then update the db off the queue
-    # to allow for faster updating? Or does it not matter since we'll do this like once a day for 3k items
-    # if each update took 1second, then we'd take like 50 minutes to update all the items?
-    items = get_all_items()
-    expired_items = get_expired(items)[:10]
-    print(f"Found {len(expired_items)} expired items to update")
-    logs = []
-    for item in expired_items:
-        item["last_updated"] = datetime.now().strftime(TIME_FORMAT)
-        update = update_item_stats(item)
-        logs.append(update)
+def log_updates(logs):
     timestamp = datetime.now().strftime("%Y-%m-%d-%H:%M:%S")
     write_dicts_to_log(logs, log_file=f"update_items_{timestamp}.log")
 
 
+def update_items(concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, batch_size=DEFAULT_BATCH_SIZE,
+                 budget=DEFAULT_BUDGET, orders=False):
+    # refresh the most overdue items first, hot items are due every few minutes and dead ones daily
+    logs = refresh_due_items(get_items_collection(), persist_items, budget=budget,
+                             concurrency=concurrency, rate=rate, batch_size=batch_size, orders=orders)
+    log_updates(logs)
+
+
+def run_update_daemon(concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, batch_size=DEFAULT_BATCH_SIZE,
+                      budget=DEFAULT_BUDGET, interval=DEFAULT_DAEMON_INTERVAL, orders=False):
+    run_daemon(get_items_collection(), persist_items, interval=interval, on_run=log_updates,
+               budget=budget, concurrency=concurrency, rate=rate, batch_size=batch_size, orders=orders)
+
+
 
 
 if __name__ == "__main__":
     DB = startup_db_client()
+    # once per run, the commands below only read and write through these indexes
+    reconcile_collection(get_items_collection(), ITEM_INDEXES)
+    # the scheduler's due item query only matches dates
+    migrate_string_dates(DB)
 
 
     parser = argparse.ArgumentParser(description="Manage your items")
     subparsers = parser.add_subparsers(dest='command', required=True, help='Available commands')
 
+    # Options shared by every command that talks to warframe.market
+    pipeline_options = argparse.ArgumentParser(add_help=False)
+    pipeline_options.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                                  help='Maximum number of upstream requests in flight')
+    pipeline_options.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                                  help='Maximum upstream requests per second')
+    pipeline_options.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                                  help='Number of items sent to the bulk endpoint per request')
+    pipeline_options.add_argument('--orders', action='store_true',
+                                  help='Also fetch the live order book and store spread and depth metrics')
+
     # Add command for adding new items
-    parser_add = subparsers.add_parser('add', help='Add new items')
+    parser_add = subparsers.add_parser('add', help='Add new items', parents=[pipeline_options])
     parser_add.set_defaults(func=add_new_items)
 
+    # Options shared by the stats refresh commands
+    refresh_options = argparse.ArgumentParser(add_help=False)
+    refresh_options.add_argument('--budget', type=int, default=DEFAULT_BUDGET,
+                                 help='Maximum upstream calls (items refreshed) per run')
+
     # Add command for updating stats
-    parser_update = subparsers.add_parser('update', help='Update item statistics')
+    parser_update = subparsers.add_parser('update', help='Update item statistics',
+                                          parents=[pipeline_options, refresh_options])
     parser_update.set_defaults(func=update_items)
 
+    # Add command for continuously updating stats
+    parser_daemon = subparsers.add_parser('daemon', help='Keep item statistics updated in the background',
+                                          parents=[pipeline_options, refresh_options])
+    parser_daemon.add_argument('--interval', type=int, default=DEFAULT_DAEMON_INTERVAL,
+                               help='Seconds between refresh runs')
+    parser_daemon.set_defaults(func=run_update_daemon)
+
     # Parse arguments and call the appropriate function
     args = parser.parse_args()
-    args.func()
+    # a refresh costs one call per endpoint, so a smaller budget couldn't refresh any item
+    min_budget = 2 if args.orders else 1
+    if getattr(args, "budget", min_budget) < min_budget:
+        parser.error(f"--budget must be at least {min_budget}{' with --orders' if args.orders else ''}")
+    options = {k: v for k, v in vars(args).items() if k not in ("command", "func")}
+    args.func(**options)
 
 
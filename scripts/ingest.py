@@ -0,0 +1,155 @@
+import asyncio
+
+import httpx
+
+from core.market_client import (DEFAULT_RATE, AsyncMarketClient, MarketAPIError,
+                                parse_item_info, parse_item_stats)
+from core.order_book import order_book_metrics, parse_orders
+
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_PERSIST_CONCURRENCY = 2
+DEFAULT_BATCH_SIZE = 500
+
+_DONE = object()
+
+
+def _failure(item, reason, status="error"):
+    return {"status": status, "details":
+            {"reason": reason,
+             "item_name": item.get("item_name", item.get("url_name"))}}
+
+
+class IngestionPipeline:
+    """
+    Fetch -> transform -> persist pipeline for warframe.market items.
+
+    Every stage runs its own workers connected by bounded queues, so while one
+    item is waiting on the backend the next ones are already being fetched.
+    Upstream fetches are capped by `concurrency` in flight and by the market
+    client's token bucket. Transformed items are persisted in batches of
+    `batch_size` by `persist_concurrency` workers.
+
+    `endpoints` are the upstream resources fetched per item ("info", "stats", "orders"),
+    `persist` is an async callable `(client, items) -> list of log entries`.
+    Order books are summarized per persist batch, in one vectorized pass over
+    every order in the batch.
+    """
+
+    def __init__(self, endpoints, persist, concurrency=DEFAULT_CONCURRENCY,
+                 persist_concurrency=DEFAULT_PERSIST_CONCURRENCY, rate=DEFAULT_RATE,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        self.endpoints = endpoints
+        self.persist = persist
+        self.concurrency = concurrency
+        self.persist_concurrency = persist_concurrency
+        self.batch_size = batch_size
+        self.rate = rate
+        self.metrics = {}
+
+    async def _fetch(self, market, item):
+        raw = {}
+        if "info" in self.endpoints:
+            raw["info"] = await market.get_item(item["url_name"])
+        if "stats" in self.endpoints:
+            raw["stats"] = await market.get_statistics(item["url_name"])
+        if "orders" in self.endpoints:
+            raw["orders"] = await market.get_orders(item["url_name"])
+        return raw
+
+    @staticmethod
+    def _transform(item, raw):
+        if "info" in raw:
+            parse_item_info(item, raw["info"])
+        if "stats" in raw:
+            parse_item_stats(item, raw["stats"])
+        if "orders" in raw:
+            # the filtered rows wait on the item until its batch is summarized
+            item["_orders"] = parse_orders(item, raw["orders"])
+        return item
+
+    @staticmethod
+    def _summarize_orders(batch):
+        """Attach order_book metrics to every item of the batch that fetched its orders"""
+        with_orders = [item for item in batch if "_orders" in item]
+        if with_orders:
+            books = [item.pop("_orders") for item in with_orders]
+            for item, metrics in zip(with_orders, order_book_metrics(books)):
+                item["order_book"] = metrics
+
+    async def _fetch_worker(self, market, inbox, outbox, logs):
+        while (item := await inbox.get()) is not _DONE:
+            try:
+                await outbox.put((item, await self._fetch(market, item)))
+            except MarketAPIError as e:
+                logs.append(_failure(item, f"fetch failed: {e}"))
+            except Exception as e:
+                # a worker that dies leaves the queues undrained and the whole run hanging
+                logs.append(_failure(item, f"fetch failed: {e!r}"))
+
+    async def _transform_worker(self, inbox, outbox, logs):
+        while (entry := await inbox.get()) is not _DONE:
+            item, raw = entry
+            try:
+                await outbox.put(self._transform(item, raw))
+            except MarketAPIError as e:
+                logs.append(_failure(item, str(e)))
+            except Exception as e:
+                logs.append(_failure(item, f"transform failed: {e!r}"))
+
+    async def _persist_batch(self, backend, batch, logs):
+        try:
+            self._summarize_orders(batch)
+            logs.extend(await self.persist(backend, batch))
+        except httpx.HTTPError as e:
+            logs.extend(_failure(item, f"persist failed: {e}") for item in batch)
+        except Exception as e:
+            logs.extend(_failure(item, f"persist failed: {e!r}") for item in batch)
+
+    async def _persist_worker(self, backend, inbox, logs):
+        batch = []
+        while (item := await inbox.get()) is not _DONE:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                await self._persist_batch(backend, batch, logs)
+                batch = []
+        if batch:
+            await self._persist_batch(backend, batch, logs)
+
+    async def run(self, items):
+        fetch_queue = asyncio.Queue()
+        transform_queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        persist_queue = asyncio.Queue(maxsize=self.batch_size * self.persist_concurrency)
+        logs = []
+        for item in items:
+            fetch_queue.put_nowait(item)
+        for _ in range(self.concurrency):
+            fetch_queue.put_nowait(_DONE)
+
+        backend_limits = httpx.Limits(max_connections=self.persist_concurrency)
+        # no ResponseCache here on purpose: the scheduler picks items because their stats
+        # (and order books) are due, a cached response would just persist the old numbers
+        async with AsyncMarketClient(rate=self.rate, max_connections=self.concurrency) as market, \
+                httpx.AsyncClient(limits=backend_limits, timeout=120) as backend:
+            fetchers = [asyncio.create_task(self._fetch_worker(market, fetch_queue, transform_queue, logs))
+                        for _ in range(self.concurrency)]
+            transformer = asyncio.create_task(self._transform_worker(transform_queue, persist_queue, logs))
+            persisters = [asyncio.create_task(self._persist_worker(backend, persist_queue, logs))
+                          for _ in range(self.persist_concurrency)]
+
+            await asyncio.gather(*fetchers)
+            await transform_queue.put(_DONE)
+            await transformer
+            for _ in persisters:
+                await persist_queue.put(_DONE)
+            await asyncio.gather(*persisters)
+            self.metrics = market.metrics.snapshot()
+        return logs
+
+
+def run_pipeline(items, endpoints, persist, **kwargs):
+    """Run the ingestion pipeline over items from synchronous code, returns the log entries"""
+    pipeline = IngestionPipeline(endpoints, persist, **kwargs)
+    logs = asyncio.run(pipeline.run(items))
+    print(f"Upstream requests: {pipeline.metrics}")
+    return logs
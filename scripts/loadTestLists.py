@@ -0,0 +1,68 @@
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+from dotenv import dotenv_values
+
+
+config = dotenv_values("../.env")
+
+
+async def get_token(client, email, password):
+    """Logs in, registering a throwaway user first when no credentials were given"""
+    if not email:
+        name = f"loadtest-{uuid.uuid4().hex[:8]}"
+        email, password = f"{name}@example.com", uuid.uuid4().hex
+        resp = await client.post("/user/register", json={"username": name, "email": email, "password": password})
+        resp.raise_for_status()
+    resp = await client.post("/user/login", json={"email": email, "password": password})
+    resp.raise_for_status()
+    return resp.json()["access_token"]
+
+
+async def timed_get(client, path, headers):
+    start = time.perf_counter()
+    resp = await client.get(path, headers=headers)
+    resp.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def run(base_url, requests, concurrency, email, password):
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        headers = {"Authorization": f"Bearer {await get_token(client, email, password)}"}
+        await timed_get(client, "/lists/", headers)  # warm up
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                return await timed_get(client, "/lists/", headers)
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*[one() for _ in range(requests)])
+        wall = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{requests} requests, {concurrency} concurrent, {wall:.2f}s wall clock")
+    print(f"throughput: {requests / wall:.1f} req/s")
+    print(f"latency p50: {statistics.median(latencies) * 1000:.1f}ms "
+          f"p95: {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}ms "
+          f"max: {latencies[-1] * 1000:.1f}ms")
+    # if the handlers serialized behind each other, the summed latency would be roughly
+    # the wall clock time; overlapping requests push this towards the concurrency level
+    print(f"effective parallelism: {sum(latencies) / wall:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test concurrent GET /lists/ requests")
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--email', help='Existing user to log in as, a throwaway user is registered otherwise')
+    parser.add_argument('--password')
+    args = parser.parse_args()
+    base_url = f"{config['BACKEND_API']}:{config['BACKEND_API_PORT']}"
+    asyncio.run(run(base_url, args.requests, args.concurrency, args.email, args.password))
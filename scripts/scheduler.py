@@ -0,0 +1,97 @@
+import time
+from datetime import datetime, timedelta
+
+from ingest import DEFAULT_BATCH_SIZE, DEFAULT_CONCURRENCY, run_pipeline
+from core.market_client import DEFAULT_RATE
+
+
+# hot items are refreshed at most this often, dead ones at least this often
+MIN_REFRESH_INTERVAL = timedelta(minutes=5)
+MAX_REFRESH_INTERVAL = timedelta(hours=24)
+ACTIVITY_WEIGHT = 12
+VOLATILITY_WEIGHT = 5
+# how much of the previous volatility is kept on every refresh
+VOLATILITY_SMOOTHING = 0.7
+DEFAULT_BUDGET = 200
+DEFAULT_DAEMON_INTERVAL = 300
+
+
+def refresh_priority_pipeline(now, budget):
+    """
+    Aggregation selecting the items most overdue for a stats refresh.
+
+    An item's refresh interval shrinks from MAX_REFRESH_INTERVAL towards
+    MIN_REFRESH_INTERVAL as its trading volume and price volatility grow,
+    and its priority is how many intervals old it is. Anything refreshed
+    within MIN_REFRESH_INTERVAL is excluded up front by the last_updated index.
+    """
+    max_ms = MAX_REFRESH_INTERVAL.total_seconds() * 1000
+    min_ms = MIN_REFRESH_INTERVAL.total_seconds() * 1000
+    activity = {"$multiply": [
+        ACTIVITY_WEIGHT,
+        {"$ln": {"$add": [1, {"$max": [0, {"$ifNull": ["$volume", 0]}]}]}},
+        {"$add": [1, {"$multiply": [VOLATILITY_WEIGHT, {"$ifNull": ["$price_volatility", 0]}]}]},
+    ]}
+    interval = {"$max": [min_ms, {"$divide": [max_ms, {"$add": [1, activity]}]}]}
+    return [
+        {"$match": {"last_updated": {"$lt": now - MIN_REFRESH_INTERVAL}}},
+        {"$addFields": {"refresh_priority": {"$divide": [
+            {"$subtract": [now, "$last_updated"]}, interval]}}},
+        {"$match": {"refresh_priority": {"$gte": 1}}},
+        {"$sort": {"refresh_priority": -1}},
+        {"$limit": budget},
+        # the order book is replaced by the orders stage or left alone, never sent back as is
+        {"$project": {"refresh_priority": 0, "order_book": 0}},
+    ]
+
+
+def select_due_items(collection, budget=DEFAULT_BUDGET, now=None):
+    now = now or datetime.now()
+    return list(collection.aggregate(refresh_priority_pipeline(now, budget)))
+
+
+def update_volatility(item, previous_price):
+    """Fold the relative price change since the last refresh into the item's smoothed volatility"""
+    if previous_price:
+        change = abs(item["median_price"] - previous_price) / previous_price
+        previous = item.get("price_volatility") or 0
+        item["price_volatility"] = round(VOLATILITY_SMOOTHING * previous + (1 - VOLATILITY_SMOOTHING) * change, 4)
+    return item
+
+
+def refresh_due_items(collection, persist, budget=DEFAULT_BUDGET, concurrency=DEFAULT_CONCURRENCY,
+                      rate=DEFAULT_RATE, batch_size=DEFAULT_BATCH_SIZE, orders=False):
+    """
+    Refresh the stats (and with orders, the live order book) of the highest priority
+    due items, spending at most `budget` upstream calls
+    """
+    endpoints = ("stats", "orders") if orders else ("stats",)
+    if budget < len(endpoints):
+        raise ValueError(f"A budget of {budget} calls can't refresh an item needing {len(endpoints)}")
+    due_items = select_due_items(collection, budget // len(endpoints))
+    print(f"Found {len(due_items)} items due for a stats refresh")
+    if not due_items:
+        return []
+    previous_prices = {item["url_name"]: item.get("median_price") for item in due_items}
+
+    async def persist_with_volatility(client, items):
+        for item in items:
+            update_volatility(item, previous_prices.get(item["url_name"]))
+        return await persist(client, items)
+
+    # one call per item and endpoint, the item count was sized to stay within the budget
+    return run_pipeline(due_items, endpoints, persist_with_volatility,
+                        concurrency=concurrency, rate=rate, batch_size=batch_size)
+
+
+def run_daemon(collection, persist, interval=DEFAULT_DAEMON_INTERVAL, on_run=None, **kwargs):
+    """Keep refreshing due items forever, sleeping `interval` seconds between runs"""
+    while True:
+        started = time.monotonic()
+        try:
+            logs = refresh_due_items(collection, persist, **kwargs)
+            if on_run and logs:
+                on_run(logs)
+        except Exception as e:
+            print(f"Refresh run failed: {e}")
+        time.sleep(max(0, interval - (time.monotonic() - started)))
@@ -0,0 +1,87 @@
+import os
+import sys
+
+import mongomock
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.config import config
+
+# settings read when the routers are imported, a developer's .env still wins
+for name, value in {"DB_NAME": "test", "TOKEN_KEY": "test-secret", "ALGORITHM": "HS256",
+                    "ACCESS_TOKEN_EXPIRE_MINUTES": "30", "BCRYPT_ROUNDS": "4", "PASSWORD_WORKERS": "1"}.items():
+    config.setdefault(name, value)
+
+# pymongo 4.11 passes a sort argument to bulk updates that mongomock 4.3 doesn't know yet
+from mongomock.collection import BulkOperationBuilder
+
+_add_update = BulkOperationBuilder.add_update
+BulkOperationBuilder.add_update = lambda self, *args, sort=None, **kwargs: _add_update(self, *args, **kwargs)
+
+import core.db
+import core.etag
+from core.alerts import QueueSink, alert_engine
+from core.auth import TokenCache, auth_service
+from core.cache import item_cache
+from core.history import PRICE_HISTORY_COLLECTION
+from core.indexes import reconcile_indexes
+from core.suggest import suggest_index
+from main import app
+
+
+@pytest.fixture
+def db():
+    """A fresh in-memory database behind the app, with every in-process cache emptied"""
+    core.db._client = mongomock.MongoClient()
+    app.database = core.db.get_database()
+    # mongomock has no time-series collections, a plain one stands in for price_history
+    app.database.create_collection(PRICE_HISTORY_COLLECTION)
+    reconcile_indexes(app.database)
+    item_cache.clear()
+    core.etag._versions.clear()
+    suggest_index.built_at = None
+    alert_engine.built_at = None
+    alert_engine.sink = QueueSink()
+    auth_service.token_cache = TokenCache()
+    yield app.database
+    core.db._client = None
+
+
+@pytest.fixture
+def client(db):
+    return TestClient(app)
+
+
+@pytest.fixture
+def make_item():
+    def make_item(url_name, **fields):
+        return {"url_name": url_name, "thumb": "thumb.png", "item_name": url_name.replace("_", " ").title(),
+                "rank": 0, "wiki_link": "", "market_link": f"https://warframe.market/items/{url_name}",
+                "median_price": 10.0, "volume": 5, "last_updated": "2025-01-30T12:34:56Z",
+                "rarity": "common", "tags": ["mod"], "item_type": "MOD", **fields}
+    return make_item
+
+
+@pytest.fixture
+def catalog_items(make_item):
+    """Items the catalog fixture stores, a test module overrides this for other prices"""
+    return [make_item(f"item_{n}", median_price=10.0 * (n + 1), volume=n) for n in range(4)]
+
+
+@pytest.fixture
+def catalog(client, db, catalog_items):
+    """Stores catalog_items, returns {url_name: _id}"""
+    client.post("/item/bulk", json=catalog_items)
+    return {doc["url_name"]: doc["_id"] for doc in db.items.find()}
+
+
+@pytest.fixture
+def login(client):
+    """Registers (once) and logs in a user, returns the Authorization header"""
+    def login(name="bob"):
+        client.post("/user/register", json={"username": name, "email": f"{name}@example.com", "password": "pw"})
+        token = client.post("/user/login", json={"email": f"{name}@example.com", "password": "pw"}).json()["access_token"]
+        return {"Authorization": f"Bearer {token}"}
+    return login
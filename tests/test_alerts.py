@@ -0,0 +1,57 @@
+import pytest
+
+import core.alerts
+from core.alerts import alert_engine
+
+
+@pytest.fixture
+def catalog_items(make_item):
+    return [make_item(f"item_{n}", median_price=100.0) for n in range(3)]
+
+
+def sent(engine=alert_engine):
+    """{email: [(url_name, drop_pct)]} of every batch handed to the sink so far"""
+    alerts = {}
+    while not engine.sink.queue.empty():
+        for alert in engine.sink.queue.get():
+            alerts.setdefault(alert["email"], []).extend((item["url_name"], item["drop_pct"]) for item in alert["items"])
+    return alerts
+
+
+@pytest.fixture
+def watchers(client, catalog, login):
+    """alice watches item_0 at 10%, bob has item_0 and item_1 in a list at 30%"""
+    alice, bob = login("alice"), login("bob")
+    client.post("/user/notifications", json={"email_alerts": True, "price_drop_threshold": 10}, headers=alice)
+    client.post("/user/notifications", json={"email_alerts": True, "price_drop_threshold": 30}, headers=bob)
+    client.post("/user/watchlist/add", json={"itemIds": [catalog["item_0"]]}, headers=alice)
+    list_id = client.post("/lists/", json={"name": "Watch"}, headers=bob).json()["_id"]
+    client.post(f"/lists/{list_id}", json={"add_items": [catalog["item_0"], catalog["item_1"]]}, headers=bob)
+    return alice, bob, list_id
+
+
+def test_drops_alert_only_watchers_past_their_threshold(client, watchers, make_item):
+    client.post("/item/bulk", json=[make_item("item_0", median_price=85.0), make_item("item_1", median_price=60.0),
+                                    make_item("item_2", median_price=1.0)])
+    assert sent() == {"alice@example.com": [("item_0", 15.0)], "bob@example.com": [("item_1", 40.0)]}
+
+
+def test_alerts_are_deduped_within_the_cooldown(client, watchers, catalog, make_item, monkeypatch):
+    client.post("/item/bulk", json=[make_item("item_0", median_price=85.0)])
+    sent()
+    client.post("/item/bulk", json=[make_item("item_0", median_price=50.0)])
+    # alice already heard about item_0, bob's threshold is only reached now
+    assert sent() == {"bob@example.com": [("item_0", 41.18)]}
+
+    monkeypatch.setattr(core.alerts, "ALERT_COOLDOWN", 0)
+    client.put(f"/item/{catalog['item_0']}", json={"median_price": 20.0})
+    assert set(sent()) == {"alice@example.com", "bob@example.com"}
+
+
+def test_index_follows_list_and_settings_changes(client, watchers, catalog):
+    alice, bob, list_id = watchers
+    client.post("/user/notifications", json={"email_alerts": False}, headers=alice)
+    client.post(f"/lists/{list_id}", json={"remove_items": [catalog["item_0"]]}, headers=bob)
+    client.put(f"/item/{catalog['item_0']}", json={"median_price": 1.0})
+    assert sent() == {}
+    assert list(alert_engine._watchers) == [catalog["item_1"]]
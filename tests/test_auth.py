@@ -0,0 +1,17 @@
+from routers.user_router import create_access_token
+
+
+def test_uid_tokens_resolve_without_a_user_lookup(client, db, login, monkeypatch):
+    headers = login("alice")
+    user_id = db.users.find_one({"email": "alice@example.com"})["_id"]
+    monkeypatch.setattr(db.users, "find_one", lambda *args, **kwargs: None)
+    assert client.post("/lists/", json={"name": "Watch"}, headers=headers).status_code == 201
+    assert db.lists.find_one({"name": "Watch"})["owner_id"] == user_id
+
+
+def test_tokens_without_uid_resolve_through_the_email(client, db, login):
+    login("alice")
+    legacy = {"Authorization": f"Bearer {create_access_token({'sub': 'alice@example.com'})}"}
+    assert client.get("/lists/", headers=legacy).status_code == 200
+    unknown = {"Authorization": f"Bearer {create_access_token({'sub': 'nobody@example.com'})}"}
+    assert client.get("/lists/", headers=unknown).status_code == 401
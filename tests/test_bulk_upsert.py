@@ -0,0 +1,31 @@
+def test_bulk_inserts_then_updates_by_url_name(client, db, make_item):
+    resp = client.post("/item/bulk", json=[make_item("serration"), make_item("hornet_strike")])
+    assert resp.status_code == 200
+    assert (resp.json()["inserted"], resp.json()["updated"], resp.json()["failed"]) == (2, 0, 0)
+
+    resp = client.post("/item/bulk", json=[make_item("serration", median_price=3.0)])
+    assert resp.json()["updated"] == 1
+    assert db.items.count_documents({}) == 2
+    assert db.items.find_one({"url_name": "serration"})["median_price"] == 3.0
+
+
+def test_bulk_reports_invalid_and_duplicate_entries(client, db, make_item):
+    bad = make_item("broken")
+    del bad["median_price"]
+    resp = client.post("/item/bulk", json=[make_item("serration", median_price=1.0), bad,
+                                           make_item("serration", median_price=2.0)])
+    results = resp.json()["results"]
+    assert [r["status"] for r in results] == ["duplicate", "invalid", "inserted"]
+    assert resp.json()["failed"] == 1
+    # the last copy of a url_name wins
+    assert db.items.find_one({"url_name": "serration"})["median_price"] == 2.0
+
+
+def test_bulk_keeps_fields_the_caller_left_out(client, db, make_item):
+    order_book = {"best_ask": 12.0, "best_bid": 9.0, "spread": 3.0, "sellers": 4, "buyers": 2,
+                  "depth_band_pct": 10.0, "updated_at": "2025-01-30T12:00:00"}
+    client.post("/item/bulk", json=[make_item("serration", order_book=order_book)])
+    client.post("/item/bulk", json=[make_item("serration", median_price=11.0)])
+    stored = db.items.find_one({"url_name": "serration"})
+    assert stored["median_price"] == 11.0
+    assert stored["order_book"]["best_ask"] == 12.0
@@ -0,0 +1,45 @@
+import core.etag
+from core.cache import item_cache
+from core.etag import ITEMS_VERSION, bump_version
+
+
+def test_unchanged_listing_answers_304_until_a_write(client, make_item):
+    client.post("/item/bulk", json=[make_item("serration", median_price=10.0)])
+    first = client.get("/item/mods")
+    etag = first.headers["ETag"]
+    assert client.get("/item/mods", headers={"If-None-Match": etag}).status_code == 304
+
+    client.post("/item/bulk", json=[make_item("serration", median_price=4.0)])
+    resp = client.get("/item/mods", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] != etag
+    assert resp.json()[0]["median_price"] == 4.0
+
+
+def test_single_item_write_drops_its_cached_read(client, db, make_item):
+    client.post("/item/bulk", json=[make_item("serration")])
+    item_id = db.items.find_one()["_id"]
+    etag = client.get(f"/item/{item_id}").headers["ETag"]
+
+    client.put(f"/item/{item_id}", json={"median_price": 2.0})
+    resp = client.get(f"/item/{item_id}", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.json()["median_price"] == 2.0
+
+
+def test_cached_body_is_not_served_under_a_newer_version(client, db, make_item):
+    client.post("/item/bulk", json=[make_item("serration", median_price=10.0)])
+    item_id = db.items.find_one()["_id"]
+    listing, single = client.get("/item/mods"), client.get(f"/item/{item_id}")
+    hits = item_cache.stats()["hits"]
+
+    # another worker writes: the shared version moves but this worker's cache is never told
+    db.items.update_one({"_id": item_id}, {"$set": {"median_price": 1.0}})
+    bump_version(db, ITEMS_VERSION)
+    core.etag._versions.clear()
+
+    resp = client.get("/item/mods", headers={"If-None-Match": listing.headers["ETag"]})
+    assert resp.status_code == 200 and resp.json()[0]["median_price"] == 1.0
+    resp = client.get(f"/item/{item_id}", headers={"If-None-Match": single.headers["ETag"]})
+    assert resp.status_code == 200 and resp.json()["median_price"] == 1.0
+    assert item_cache.stats()["hits"] == hits
@@ -0,0 +1,20 @@
+from datetime import datetime
+
+import mongomock
+
+from core.indexes import dedupe_items, reconcile_collection
+from models.itemModels import ITEM_INDEXES
+
+
+def test_dedupe_unblocks_the_unique_url_name_index():
+    items = mongomock.MongoClient().db.items
+    items.insert_many([
+        {"_id": "old", "url_name": "serration", "last_updated": datetime(2024, 1, 1)},
+        {"_id": "new", "url_name": "serration", "last_updated": datetime(2025, 1, 1)},
+        {"_id": "single", "url_name": "vitality", "last_updated": datetime(2023, 1, 1)},
+    ])
+    assert "url_name" in reconcile_collection(items, ITEM_INDEXES)["failed"]
+
+    assert dedupe_items(items) == ["old"]
+    assert sorted(doc["_id"] for doc in items.find()) == ["new", "single"]
+    assert reconcile_collection(items, ITEM_INDEXES)["created"] == ["url_name"]
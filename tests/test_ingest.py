@@ -0,0 +1,43 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from ingest import IngestionPipeline
+
+
+class OfflinePipeline(IngestionPipeline):
+    """Answers fetches from a dict instead of warframe.market"""
+
+    async def _fetch(self, market, item):
+        if item["url_name"] == "bad_json":
+            raise ValueError("Expecting value: line 1 column 1")
+        return {"stats": {"payload": {}}} if item["url_name"] == "odd_payload" else {}
+
+
+async def persist(client, items):
+    if any(item["url_name"] == "bad_batch" for item in items):
+        raise KeyError("results")
+    return [{"status": "ok", "details": item["url_name"]} for item in items]
+
+
+def test_unexpected_errors_are_logged_and_the_run_finishes():
+    names = ["fine", "bad_json", "odd_payload", "bad_batch"] * 10
+    pipeline = OfflinePipeline(("stats",), persist, concurrency=2, batch_size=1)
+    logs = asyncio.run(asyncio.wait_for(pipeline.run([{"url_name": name} for name in names]), timeout=10))
+    assert len(logs) == len(names)
+    statuses = {}
+    for log in logs:
+        name = log["details"] if log["status"] == "ok" else log["details"]["item_name"]
+        statuses.setdefault(name, set()).add(log["status"])
+    assert statuses == {"fine": {"ok"}, "bad_json": {"error"}, "odd_payload": {"error"}, "bad_batch": {"error"}}
+
+
+def test_refresh_budget_must_cover_every_endpoint(db):
+    from scheduler import refresh_due_items
+
+    with pytest.raises(ValueError):
+        refresh_due_items(db.items, persist, budget=1, orders=True)
@@ -0,0 +1,24 @@
+from core.cache import item_cache
+
+
+def test_query_filters_on_every_condition(client, make_item):
+    client.post("/item/bulk", json=[
+        make_item("cheap_rare", median_price=5.0, rarity="rare", tags=["mod", "rare"]),
+        make_item("pricey_rare", median_price=50.0, rarity="rare", tags=["mod", "rare"]),
+        make_item("cheap_common", median_price=5.0, rarity="common"),
+    ])
+    resp = client.post("/item/query", json={"item_type": "MOD", "max_price": 10, "tags_all": ["rare"]})
+    assert [item["url_name"] for item in resp.json()] == ["cheap_rare"]
+    assert client.post("/item/query", json={"unknown": 1}).status_code == 422
+
+
+def test_bulk_write_drops_cached_query_of_any_item_type(client, make_item):
+    client.post("/item/bulk", json=[make_item("relic", item_type="OTHER", median_price=11.0)])
+    query = {"item_type": "OTHER"}
+    first = client.post("/item/query", json=query)
+    assert first.json()[0]["median_price"] == 11.0
+
+    client.post("/item/bulk", json=[make_item("relic", item_type="OTHER", median_price=3.0)])
+    # the write drops the entry itself, not just moves the ETag version past it
+    assert item_cache.stats()["entries"] == 0
+    assert client.post("/item/query", json=query).json()[0]["median_price"] == 3.0
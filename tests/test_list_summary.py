@@ -0,0 +1,62 @@
+from core.list_summary import rebuild_summaries
+
+
+def summaries(client, headers):
+    return {lst["name"]: lst["summary"] for lst in client.get("/lists/", headers=headers).json()}
+
+
+def test_membership_changes_move_the_summary(client, catalog, login):
+    headers = login()
+    list_id = client.post("/lists/", json={"name": "Watch"}, headers=headers).json()["_id"]
+    client.post(f"/lists/{list_id}", json={"add_items": [catalog["item_0"], catalog["item_1"], "deleted-item"]},
+                headers=headers)
+    # re-adding is a no-op for the summary
+    client.post(f"/lists/{list_id}", json={"add_items": [catalog["item_1"], catalog["item_2"]]}, headers=headers)
+    client.post(f"/lists/{list_id}", json={"remove_items": [catalog["item_0"], catalog["item_3"]]}, headers=headers)
+
+    summary = summaries(client, headers)["Watch"]
+    assert (summary["item_count"], summary["price_total"], summary["volume_total"]) == (2, 50.0, 3.0)
+    assert summary["price_avg"] == 25.0
+
+
+def test_ingest_and_delete_update_every_list_holding_the_item(client, catalog, login, make_item):
+    headers = login()
+    for name, items in (("A", ["item_1", "item_2"]), ("B", ["item_2"])):
+        list_id = client.post("/lists/", json={"name": name}, headers=headers).json()["_id"]
+        client.post(f"/lists/{list_id}", json={"add_items": [catalog[i] for i in items]}, headers=headers)
+    etag = client.get("/lists/", headers=headers).headers["ETag"]
+
+    client.post("/item/bulk", json=[make_item("item_2", median_price=35.0, volume=2)])
+    assert client.get("/lists/", headers={**headers, "If-None-Match": etag}).status_code == 200
+    current = summaries(client, headers)
+    assert (current["A"]["price_total"], current["A"]["price_change"]) == (55.0, 5.0)
+    assert (current["B"]["price_total"], current["B"]["price_change"]) == (35.0, 5.0)
+
+    client.delete(f"/item/{catalog['item_2']}")
+    current = summaries(client, headers)
+    assert (current["A"]["item_count"], current["A"]["price_total"]) == (1, 20.0)
+    assert (current["B"]["item_count"], current["B"]["price_total"]) == (0, 0.0)
+
+
+def test_rebuild_matches_incremental_summaries(client, db, catalog, login, make_item):
+    headers = login()
+    list_id = client.post("/lists/", json={"name": "Watch"}, headers=headers).json()["_id"]
+    client.post(f"/lists/{list_id}", json={"add_items": list(catalog.values())}, headers=headers)
+    client.put(f"/item/{catalog['item_3']}", json={"median_price": 1.0})
+    incremental = summaries(client, headers)["Watch"]
+
+    db.lists.update_many({}, {"$unset": {"summary": ""}})
+    rebuild_summaries(db, {"summary": {"$exists": False}})
+    rebuilt = summaries(client, headers)["Watch"]
+    for field in ("item_count", "price_total", "volume_total"):
+        assert rebuilt[field] == incremental[field]
+
+
+def test_update_diffs_against_the_pre_image(client, db, catalog, login):
+    headers = login()
+    list_id = client.post("/lists/", json={"name": "Watch"}, headers=headers).json()["_id"]
+    # item_0 is already in the stored list, so only item_1 joins it
+    db.lists.update_one({"name": "Watch"}, {"$push": {"items": catalog["item_0"]}})
+    client.post(f"/lists/{list_id}", json={"add_items": [catalog["item_0"], catalog["item_1"]]}, headers=headers)
+    assert summaries(client, headers)["Watch"]["item_count"] == 1
+    assert client.post(f"/lists/{list_id}", json={"name": "x"}, headers=login("mallory")).status_code == 404
@@ -0,0 +1,46 @@
+import threading
+import time
+
+from core.market_client import CircuitBreaker
+
+
+def test_breaker_opens_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.wait_time() == 0
+    breaker.record_failure()
+    assert breaker.is_open and breaker.wait_time() > 0
+
+
+def test_half_open_lets_exactly_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+    breaker.TRIAL_POLL_INTERVAL = 0.02
+    breaker.record_failure()
+    time.sleep(0.12)
+    sends = []
+
+    def caller():
+        while (pause := breaker.wait_time()) > 0:
+            time.sleep(pause)
+        sends.append(time.monotonic())
+        if len(sends) == 1:
+            time.sleep(0.05)
+            breaker.record_success()
+
+    threads = [threading.Thread(target=caller) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(sends) == 8
+    # nobody else went out while the trial was in flight
+    assert min(sends[1:]) - sends[0] >= 0.04
+
+
+def test_failed_trial_opens_another_round():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.wait_time() == 0
+    breaker.record_failure()
+    assert breaker.wait_time() > 0.03
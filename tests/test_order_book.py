@@ -0,0 +1,26 @@
+from core.order_book import order_book_metrics, parse_orders
+
+
+def order(price, quantity=1, order_type="sell", status="ingame", **fields):
+    return {"platinum": price, "quantity": quantity, "order_type": order_type, "user": {"status": status}, **fields}
+
+
+def test_parse_orders_keeps_visible_online_orders_at_the_item_rank():
+    payload = {"orders": [order(10), order(11, status="offline"), order(12, visible=False),
+                          order(13, mod_rank=10), order(9, order_type="buy", mod_rank=0)]}
+    assert parse_orders({"url_name": "serration", "rank": 0}, payload) == [(10, 1, True), (9, 1, False)]
+
+
+def test_metrics_per_book():
+    books = [
+        [(10, 2, True), (10.5, 1, True), (30, 5, True), (8, 3, False), (7.5, 1, False)],
+        [(5, 1, True)],
+        [],
+    ]
+    full, asks_only, empty = order_book_metrics(books, band=0.1, fair_orders=5)
+    assert (full["best_ask"], full["best_bid"], full["spread"], full["spread_pct"]) == (10.0, 8.0, 2.0, 20.0)
+    # 30 is outside the 10% band of the best ask, 7.5 within 10% of the best bid
+    assert (full["ask_depth"], full["bid_depth"], full["sellers"], full["buyers"]) == (3, 4, 3, 2)
+    assert full["fair_price"] == 10.5
+    assert (asks_only["best_bid"], asks_only["spread"], asks_only["fair_price"]) == (None, None, 5.0)
+    assert (empty["best_ask"], empty["sellers"], empty["fair_price"]) == (None, 0, None)
@@ -0,0 +1,53 @@
+from core.pagination import NEXT_CURSOR_HEADER
+
+
+def read_all(client, path, **params):
+    """Follows X-Next-Cursor until the last page, returns the pages' url_names"""
+    pages, cursor = [], None
+    while True:
+        resp = client.get(path, params={**params, **({"next": cursor} if cursor else {})})
+        assert resp.status_code == 200
+        pages.append([item["url_name"] for item in resp.json()])
+        if (cursor := resp.headers.get(NEXT_CURSOR_HEADER)) is None:
+            return pages
+
+
+def test_keyset_pages_cover_every_item_once(client, make_item):
+    # equal prices make the _id tie breaker matter
+    client.post("/item/bulk", json=[make_item(f"mod_{n:02}", median_price=n % 3) for n in range(7)])
+    pages = read_all(client, "/item/mods", limit=3, sort="median_price", order="desc")
+    assert [len(page) for page in pages] == [3, 3, 1]
+    seen = [url_name for page in pages for url_name in page]
+    assert sorted(seen) == [f"mod_{n:02}" for n in range(7)]
+
+
+def test_pages_follow_the_sort_order(client, make_item):
+    client.post("/item/bulk", json=[make_item(name) for name in ("c_mod", "a_mod", "b_mod")])
+    assert read_all(client, "/item/mods", limit=2) == [["a_mod", "b_mod"], ["c_mod"]]
+
+
+def test_cursor_from_another_sort_is_rejected(client, make_item):
+    client.post("/item/bulk", json=[make_item(f"mod_{n}") for n in range(3)])
+    cursor = client.get("/item/mods", params={"limit": 1}).headers[NEXT_CURSOR_HEADER]
+    resp = client.get("/item/mods", params={"limit": 1, "sort": "volume", "next": cursor})
+    assert resp.status_code == 400
+    assert client.get("/item/mods", params={"next": "not-a-cursor"}).status_code == 400
+
+
+def test_created_and_bulk_items_page_together_on_last_updated(client, db, make_item):
+    client.post("/item/", json=make_item("created", last_updated="2025-01-01T00:00:00Z"))
+    client.post("/item/bulk", json=[make_item("bulk_new", last_updated="2025-03-01T00:00:00Z"),
+                                    make_item("bulk_old", last_updated="2024-06-01T00:00:00Z")])
+    assert db.items.count_documents({"last_updated": {"$type": "date"}}) == 3
+    pages = read_all(client, "/item/", limit=1, sort="last_updated")
+    assert pages == [["bulk_old"], ["created"], ["bulk_new"]]
+
+
+def test_string_dates_are_migrated(db, make_item):
+    from core.migrations import migrate_string_dates
+
+    db.items.insert_many([{"_id": "a", "url_name": "a", "last_updated": "2025-01-30T12:34:56.00Z"},
+                          {"_id": "b", "url_name": "b", "last_updated": "yesterday"}])
+    assert migrate_string_dates(db) == 1
+    assert db.items.find_one({"_id": "a"})["last_updated"].year == 2025
+    assert db.items.find_one({"_id": "b"})["last_updated"] == "yesterday"
@@ -0,0 +1,34 @@
+from core.pagination import NEXT_CURSOR_HEADER
+
+
+def ranked(url_name, rank_0, rank_10, **fields):
+    return {"rank_stats": {"0": {"median_price": rank_0, "volume": 1}, "10": {"median_price": rank_10, "volume": 1}},
+            "median_price": rank_0, **fields}
+
+
+def test_rank_listing_sorts_and_pages_on_that_rank(client, make_item):
+    client.post("/item/bulk", json=[
+        make_item("serration", **ranked("serration", 60.0, 500.0)),
+        make_item("hornet_strike", **ranked("hornet_strike", 80.0, 90.0)),
+        make_item("vitality", **ranked("vitality", 100.0, 40.0)),
+        # without ranks the top-level price is reported, and sorted on
+        make_item("unranked", median_price=70.0),
+    ])
+    params = {"rank": 10, "sort": "median_price", "order": "desc", "limit": 2}
+    first = client.get("/item/mods", params=params)
+    assert [(i["url_name"], i["median_price"]) for i in first.json()] == [("serration", 500.0), ("hornet_strike", 90.0)]
+
+    cursor = first.headers[NEXT_CURSOR_HEADER]
+    second = client.get("/item/mods", params={**params, "next": cursor})
+    assert [i["url_name"] for i in second.json()] == ["unranked", "vitality"]
+    assert NEXT_CURSOR_HEADER not in second.headers
+
+    # a rank 10 cursor doesn't page a rank 0 listing
+    assert client.get("/item/mods", params={**params, "rank": 0, "next": cursor}).status_code == 400
+
+
+def test_rank_sort_with_sparse_fields(client, make_item):
+    client.post("/item/bulk", json=[make_item("serration", **ranked("serration", 60.0, 500.0)),
+                                    make_item("vitality", **ranked("vitality", 100.0, 40.0))])
+    resp = client.get("/item/mods", params={"rank": 10, "sort": "median_price", "fields": "url_name,median_price"})
+    assert [(i["url_name"], i["median_price"]) for i in resp.json()] == [("vitality", 40.0), ("serration", 500.0)]